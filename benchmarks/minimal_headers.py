@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compares the package size and the pack (conan upload) and unpack (conan install) time of the
+# whole boost/ include tree with the minimal_headers=True closure.
+#
+#   python benchmarks/minimal_headers.py boost_1_75_0 --libs filesystem regex --header-only asio
+
+import argparse
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from conanfile import header_closure, header_seeds, lib_closure, lib_list
+
+
+def pack_unpack(include_root, headers, workdir):
+    archive = os.path.join(workdir, "conan_package.tgz")
+    start = time.time()
+    with tarfile.open(archive, "w:gz") as tar:
+        for relpath in sorted(headers):
+            tar.add(os.path.join(include_root, relpath), arcname="include/%s" % relpath)
+    packed = time.time()
+    with tarfile.open(archive) as tar:
+        tar.extractall(os.path.join(workdir, "package"))
+    return packed - start, time.time() - packed, os.path.getsize(archive)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("boost_folder", help="extracted boost_1_75_0 source tree")
+    parser.add_argument("--libs", nargs="*", default=lib_list, choices=lib_list)
+    parser.add_argument("--header-only", nargs="*", default=[])
+    args = parser.parse_args()
+
+    full = []
+    for root, _, filenames in os.walk(os.path.join(args.boost_folder, "boost")):
+        full.extend(os.path.relpath(os.path.join(root, name), args.boost_folder) for name in filenames)
+    start = time.time()
+    minimal = header_closure(args.boost_folder, header_seeds(sorted(lib_closure(args.libs)) + args.header_only))
+    print("closure computed in %.2fs" % (time.time() - start))
+
+    print("%-10s %8s %12s %12s %10s %10s" % ("headers", "files", "size [MB]", "tgz [MB]", "pack [s]", "unpack [s]"))
+    for name, headers in (("full", full), ("minimal", minimal)):
+        workdir = tempfile.mkdtemp(prefix="boost_headers_bench")
+        try:
+            size = sum(os.path.getsize(os.path.join(args.boost_folder, relpath)) for relpath in headers)
+            pack, unpack, archive_size = pack_unpack(args.boost_folder, headers, workdir)
+            print("%-10s %8d %12.1f %12.1f %10.2f %10.2f" % (name, len(headers), size / 1e6,
+                                                            archive_size / 1e6, pack, unpack))
+        finally:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
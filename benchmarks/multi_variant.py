@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compares building the Debug/Release x static/shared variants with one b2 run per configuration
+# against CONAN_BOOST_MULTI_VARIANT=1: a single compile run plus one link-only stage run per variant.
+# Needs a bootstrapped Boost tree.
+#
+#   python benchmarks/multi_variant.py ~/boost_1_75_0 --toolset gcc --with regex filesystem
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+variants = [(variant, link) for variant in ("release", "debug") for link in ("static", "shared")]
+
+
+def b2(args, boost_root, build_dir, flags):
+    command = [os.path.join(boost_root, "b2"), "toolset=%s" % args.toolset, "-j%d" % args.jobs,
+               "--build-dir=%s" % build_dir] + ["--with-%s" % lib for lib in args.with_libs] + flags
+    subprocess.check_call(command, cwd=boost_root, stdout=subprocess.DEVNULL)
+
+
+def per_configuration(args, workdir):
+    for variant, link in variants:
+        build_dir = os.path.join(workdir, "%s-%s" % (variant, link))
+        b2(args, args.boost_root, build_dir, ["variant=%s" % variant, "link=%s" % link,
+                                              "--stagedir=%s" % os.path.join(build_dir, "stage")])
+
+
+def multi_variant(args, workdir):
+    build_dir = os.path.join(workdir, "multi")
+    b2(args, args.boost_root, build_dir, ["variant=release,debug", "link=static,shared", "--layout=tagged",
+                                          "--stagedir=%s" % os.path.join(build_dir, "scratch")])
+    for variant, link in variants:
+        b2(args, args.boost_root, build_dir, ["variant=%s" % variant, "link=%s" % link,
+                                              "--stagedir=%s" % os.path.join(build_dir, "stage-%s-%s" % (variant, link))])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("boost_root")
+    parser.add_argument("--toolset", default="gcc")
+    parser.add_argument("--with", dest="with_libs", nargs="+", default=["regex", "filesystem", "serialization"])
+    parser.add_argument("-j", dest="jobs", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    for name, run in (("per configuration", per_configuration), ("multi variant", multi_variant)):
+        workdir = tempfile.mkdtemp(prefix="boost_variant_bench")
+        try:
+            start = time.time()
+            run(args, workdir)
+            print("%-18s %8.1f s" % (name, time.time() - start))
+        finally:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compares the former download-unzip-unlink source() path with the streaming extraction of the
+# full and of the lean (CONAN_BOOST_LEAN_SOURCES=1) source tree.
+#
+#   python benchmarks/source_extraction.py boost_1_75_0.tar.gz --without log wave graph mpi python
+
+import argparse
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from conanfile import BoostConan, HashingReader, lean_source_filter, lib_list
+
+
+def tree_stats(folder):
+    files, size = 0, 0
+    for root, dirs, filenames in os.walk(folder):
+        files += len(dirs) + len(filenames)
+        size += sum(os.lstat(os.path.join(root, name)).st_size for name in filenames)
+    return files, size
+
+
+def unzip_path(archive, workdir):
+    local_archive = os.path.join(workdir, os.path.basename(archive))
+    shutil.copyfile(archive, local_archive)
+    with tarfile.open(local_archive) as tar:
+        tar.extractall(workdir)
+    os.unlink(local_archive)
+    return os.path.getsize(archive)
+
+
+def streaming_path(archive, workdir, keep=None):
+    with open(archive, "rb") as stream:
+        with tarfile.open(fileobj=HashingReader(stream), mode="r|gz") as tar:
+            for member in tar:
+                if keep is None or keep(member.name):
+                    tar.extract(member, workdir)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("archive")
+    parser.add_argument("--without", nargs="*", default=[], choices=lib_list)
+    args = parser.parse_args()
+
+    runs = [("download+unzip", lambda w: unzip_path(args.archive, w)),
+            ("streaming", lambda w: streaming_path(args.archive, w)),
+            ("streaming lean", lambda w: streaming_path(args.archive, w,
+                                                        lean_source_filter(BoostConan.folder_name, args.without)))]
+    print("%-16s %10s %10s %14s" % ("path", "wall [s]", "inodes", "written [MB]"))
+    for name, run in runs:
+        workdir = tempfile.mkdtemp(prefix="boost_source_bench")
+        try:
+            start = time.time()
+            archive_bytes = run(workdir)
+            elapsed = time.time() - start
+            inodes, size = tree_stats(workdir)
+            print("%-16s %10.2f %10d %14.1f" % (name, elapsed, inodes, (size + archive_bytes) / 1e6))
+        finally:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compares the b2 build time of the libraries compiled file by file and with unity_build=True, and
+# the symbols the two builds export from each library (nm --defined-only).
+#
+#   python benchmarks/unity_build.py boost_1_75_0 --libs regex filesystem program_options -j8
+#
+# The boost folder needs a bootstrapped b2, its sources are restored when done.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from conanfile import lib_list, restore_unity_sources, unity_excluded_libs, unity_sources, write_unity_sources
+
+
+def build(boost_folder, b2, libs, jobs, link, workdir):
+    command = [b2, "-j%d" % jobs, "--build-dir=%s" % os.path.join(workdir, "build"),
+               "--stagedir=%s" % os.path.join(workdir, "stage"), "variant=release", "link=%s" % link,
+               "threading=multi", "--layout=system"] + ["--with-%s" % libname for libname in libs]
+    start = time.time()
+    with open(os.path.join(workdir, "b2.log"), "w") as log:
+        subprocess.check_call(command, cwd=boost_folder, stdout=log, stderr=subprocess.STDOUT)
+    return time.time() - start
+
+
+def exported_symbols(stage_lib):
+    symbols = {}
+    for filename in sorted(os.listdir(stage_lib)):
+        path = os.path.join(stage_lib, filename)
+        if os.path.islink(path) or not filename.startswith("libboost_"):
+            continue
+        dynamic = ["-D"] if ".so" in filename else []
+        output = subprocess.check_output(["nm", "--defined-only", "--extern-only"] + dynamic + [path]).decode()
+        symbols[filename] = set(" ".join(line.split()[-2:]) for line in output.splitlines() if len(line.split()) >= 2)
+    return symbols
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("boost_folder", help="extracted and bootstrapped boost_1_75_0 source tree")
+    parser.add_argument("--libs", nargs="*", choices=lib_list,
+                        default=[libname for libname in sorted(lib_list) if libname not in unity_excluded_libs])
+    parser.add_argument("--b2", default=None, help="b2 executable, <boost_folder>/b2 by default")
+    parser.add_argument("--link", default="shared", choices=["shared", "static"])
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    b2 = args.b2 or os.path.join(os.path.abspath(args.boost_folder), "b2")
+
+    plan = {}
+    for libname in args.libs:
+        sources = unity_sources(os.path.join(args.boost_folder, "libs", libname))
+        if len(sources) > 1:
+            plan[libname] = sources
+    print("merging %s" % ", ".join("%s (%d)" % (libname, len(plan[libname])) for libname in sorted(plan)))
+
+    times, symbols, workdirs = {}, {}, []
+    try:
+        for mode in ("normal", "unity"):
+            workdir = tempfile.mkdtemp(prefix="boost_unity_bench")
+            workdirs.append(workdir)
+            if mode == "unity":
+                for libname, sources in plan.items():
+                    write_unity_sources(os.path.join(args.boost_folder, "libs", libname, "src"), sources)
+            try:
+                times[mode] = build(args.boost_folder, b2, args.libs, args.jobs, args.link, workdir)
+            finally:
+                for libname, sources in plan.items():
+                    restore_unity_sources(os.path.join(args.boost_folder, "libs", libname, "src"), sources)
+            symbols[mode] = exported_symbols(os.path.join(workdir, "stage", "lib"))
+
+        print("%-8s %10s" % ("build", "time [s]"))
+        for mode in ("normal", "unity"):
+            print("%-8s %10.1f" % (mode, times[mode]))
+        print("\n%-40s %10s %10s %10s" % ("library", "symbols", "missing", "extra"))
+        equivalent = True
+        for filename in sorted(set(symbols["normal"]) | set(symbols["unity"])):
+            normal, unity = symbols["normal"].get(filename, set()), symbols["unity"].get(filename, set())
+            equivalent = equivalent and normal == unity
+            print("%-40s %10d %10d %10d" % (filename, len(normal), len(normal - unity), len(unity - normal)))
+            for symbol in sorted(normal - unity)[:5]:
+                print("    missing: %s" % symbol)
+        print("\nexported symbols %s" % ("identical" if equivalent else "differ, exclude the libraries above"))
+        return 0 if equivalent else 1
+    finally:
+        for workdir in workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,9 +2,16 @@
 # -*- coding: utf-8 -*-
 
 from conan.packager import ConanMultiPackager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import multiprocessing
 import os
 import re
 import platform
+import subprocess
+import sys
+import tempfile
+import time
 
 
 def get_value_from_recipe(search_string):
@@ -100,10 +107,316 @@ def add_ubitrack_build_options(items):
     return builds
 
 
+def split_options(options):
+    without = set(key for key, value in options.items() if ":without_" in key and value)
+    common = dict((key, value) for key, value in options.items() if ":without_" not in key)
+    return common, without
 
 
+def is_derived_build(build, builds):
+    """A build disabling a superset of the libraries of another one with the same settings and
+    other options reuses its staged binaries (CONAN_BOOST_STAGE_REUSE), so it has to run after it
+    """
+    common, without = split_options(build[1])
+    for other in builds:
+        other_common, other_without = split_options(other[1])
+        # Options missing on one side are left at their recipe default
+        shared_keys = set(common) & set(other_common)
+        if other[0] == build[0] and other_without < without and \
+                all(common[key] == other_common[key] for key in shared_keys):
+            return True
+    return False
+
+
+def variant_group(build):
+    # RelWithDebInfo and MinSizeRel are no multi-variant siblings, each is a group of its own
+    siblings = build[0].get("build_type") in ("Release", "Debug")
+    settings = sorted((key, value) for key, value in build[0].items() if key != "build_type" or not siblings)
+    options = sorted((key, value) for key, value in build[1].items() if not key.endswith(":shared"))
+    return settings, options
+
+
+def build_wave(build, builds):
+    """Builds of a wave only depend on the stages published by earlier waves: full builds first,
+    then their CONAN_BOOST_MULTI_VARIANT siblings, then the derived library subsets
+    """
+    if is_derived_build(build, builds):
+        return 2
+    if os.getenv("CONAN_BOOST_MULTI_VARIANT", "0") in ("1", "true", "yes"):
+        leader = next(other for other in builds if variant_group(other) == variant_group(build))
+        if leader is not build:
+            return 1
+    return 0
+
+
+def use_shared_headers():
+    return os.getenv("CONAN_BOOST_SHARED_HEADERS", "0").lower() in ("1", "true", "yes")
+
+
+def add_shared_headers_option(items, name):
+    """All binary packages require the Boost-headers package instead of carrying the headers"""
+    builds = []
+    for settings, options, env_vars, build_requires, reference in items:
+        options = dict(options)
+        if not options.get(name + ":header_only"):
+            options[name + ":shared_headers"] = True
+        builds.append([settings, options, env_vars, build_requires, reference])
+    return builds
+
+
+def create_header_package(username, channel):
+    """headers/conanfile.py python_requires the main recipe, so that one is exported first"""
+    user_channel = "%s/%s" % (username, channel)
+    subprocess.check_call(["conan", "export", ".", user_channel])
+    subprocess.check_call(["conan", "create", "headers", user_channel])
+
+
+def use_build_plan():
+    return os.getenv("CONAN_BOOST_PLAN", "0").lower() in ("1", "true", "yes")
+
+
+def conan_json(command):
+    """Runs a conan command with --json and returns the parsed output"""
+    handle, path = tempfile.mkstemp(suffix=".json")
+    os.close(handle)
+    try:
+        subprocess.check_output(command + ["--json", path], stderr=subprocess.STDOUT)
+        with open(path) as output:
+            return json.load(output)
+    finally:
+        os.unlink(path)
+
+
+def get_package_id(build, reference, profile_dir, index):
+    settings, options, env_vars, build_requires = build[:4]
+    profile = os.path.join(profile_dir, "%03d.profile" % index)
+    write_profile(profile, settings, options, env_vars, build_requires)
+    nodes = conan_json(["conan", "info", reference, "-pr", profile, "--only", "id"])
+    return next(node["id"] for node in nodes if node["reference"] == reference)
+
+
+def get_available_package_ids(reference, remote=None):
+    """Package ids of reference in the local cache, or in a remote. The remote is a conan remote
+    name, or a folder holding one entry per package id (e.g. a copy of the cache's package folder)
+    """
+    if remote and os.path.isdir(remote):
+        return set(os.listdir(remote))
+    command = ["conan", "search", reference] + (["-r", remote] if remote else [])
+    try:
+        found = conan_json(command)
+    except subprocess.CalledProcessError:  # no package, or no recipe, at all
+        return set()
+    return set(package["id"] for result in found.get("results", []) for item in result["items"]
+               for package in item.get("packages", []))
+
+
+def plan_builds(builds, reference):
+    """Computes the package id of every configuration and keeps only the ones neither in the
+    local cache nor in CONAN_BOOST_PLAN_REMOTE
+    """
+    subprocess.check_call(["conan", "export", ".", reference.split("@")[1]])
+    local = get_available_package_ids(reference)
+    remote = os.getenv("CONAN_BOOST_PLAN_REMOTE")
+    remote_ids = get_available_package_ids(reference, remote) if remote else set()
+    profile_dir = tempfile.mkdtemp(prefix="boost_plan_")
+
+    missing = []
+    counts = {"build": 0, "skip": 0, "download": 0}
+    print("%-4s %-8s %-40s  %s" % ("#", "plan", "package id", "configuration"))
+    for index, build in enumerate(builds):
+        package_id = get_package_id(build, reference, profile_dir, index)
+        if package_id in local:
+            action = "skip"
+        elif package_id in remote_ids:
+            action = "download"
+        else:
+            action = "build"
+            missing.append(build)
+        counts[action] += 1
+        print("%-4d %-8s %-40s  %s" % (index, action, package_id, describe_build(build[0], build[1])))
+    print("Plan: %(build)d to build, %(skip)d in the local cache, %(download)d in the remote" % counts)
+    return missing
+
+
+def get_parallel_builds():
+    return int(os.getenv("CONAN_BOOST_PARALLEL_BUILDS", "1"))
+
+
+def get_job_budget():
+    return int(os.getenv("CONAN_BOOST_JOB_BUDGET", "0")) or multiprocessing.cpu_count()
+
+
+def get_memory_share(parallel):
+    """The memory each of the parallel builds sizes its b2 -j for, in MB, None if unknown"""
+    from conanfile import available_memory_mb
+    memory = available_memory_mb()
+    return memory // parallel if memory else None
+
+
+def describe_build(settings, options):
+    description = [str(settings[key]) for key in ("compiler", "compiler.version", "arch", "build_type")
+                   if settings.get(key)]
+    description += ["%s=%s" % (key.split(":")[-1], value) for key, value in sorted(options.items())
+                    if key.endswith(":shared")]
+    disabled = [key for key, value in options.items() if ":without_" in key and value]
+    if disabled:
+        description.append("without %d libs" % len(disabled))
+    return " ".join(description)
+
+
+def write_profile(path, settings, options, env_vars, build_requires):
+    lines = ["include(default)", "[settings]"]
+    lines += ["%s=%s" % item for item in sorted(settings.items())]
+    lines += ["[options]"] + ["%s=%s" % item for item in sorted(options.items())]
+    lines += ["[env]"] + ["%s=%s" % item for item in sorted(env_vars.items())]
+    lines += ["[build_requires]"] + ["%s: %s" % (pattern, ", ".join(refs))
+                                     for pattern, refs in sorted((build_requires or {}).items())]
+    with open(path, "w") as profile:
+        profile.write("\n".join(lines) + "\n")
+
+
+def run_build(index, build, name, reference, jobs, memory, log_dir):
+    """Builds and tests one configuration of the already exported recipe,
+    returns the status and the elapsed time"""
+    settings, options, env_vars, build_requires = build[:4]
+    profile = os.path.join(log_dir, "%03d.profile" % index)
+    write_profile(profile, settings, options, env_vars, build_requires)
+    env = dict(os.environ, CONAN_BOOST_B2_JOBS=str(jobs))
+    if memory:
+        # Otherwise every configuration would fit its jobs into the whole machine's memory
+        env["CONAN_BOOST_MEMORY_LIMIT_MB"] = str(memory)
+    start = time.time()
+    with open(os.path.join(log_dir, "%03d.log" % index), "w") as log:
+        for command in (["conan", "install", reference, "--build=%s" % name, "-pr", profile],
+                        ["conan", "test", "test_package", reference, "-pr", profile]):
+            log.write("$ %s\n" % " ".join(command))
+            log.flush()
+            if subprocess.call(command, stdout=log, stderr=subprocess.STDOUT, env=env) != 0:
+                return "FAILED", time.time() - start
+    return "ok", time.time() - start
+
+
+def run_parallel(builds, name, reference, parallel, job_budget):
+    """Runs up to `parallel` configurations at once, each b2 limited to its share of the job
+    budget and of the available memory. The first failure stops scheduling new configurations, the running ones are still
+    waited for so every outcome ends up in the summary. Returns True if all builds succeeded
+    """
+    jobs = max(1, job_budget // parallel)
+    memory = get_memory_share(parallel)
+    log_dir = tempfile.mkdtemp(prefix="boost_builds_")
+    print("Building %d configurations, %d at once with -j%d and %s MB each, logs in %s"
+          % (len(builds), parallel, jobs, memory or "unknown", log_dir))
+    subprocess.check_call(["conan", "export", ".", reference.split("@")[1]])
+
+    outcomes = {}
+    waves = [build_wave(build, builds) for build in builds]
+    for wave in sorted(set(waves)):
+        if any(status != "ok" for status, _ in outcomes.values()):
+            break
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            futures = {pool.submit(run_build, index, build, name, reference, jobs, memory, log_dir): index
+                       for index, build in enumerate(builds) if waves[index] == wave}
+            for future in as_completed(futures):
+                index = futures[future]
+                if future.cancelled():
+                    continue
+                outcomes[index] = future.result()
+                if outcomes[index][0] != "ok":
+                    print("Configuration %d failed, see %s" % (index, os.path.join(log_dir, "%03d.log" % index)))
+                    for pending in futures:
+                        pending.cancel()
+
+    print("%-4s %-8s %10s  %s" % ("#", "status", "time [s]", "configuration"))
+    for index, build in enumerate(builds):
+        status, elapsed = outcomes.get(index, ("skipped", None))
+        print("%-4d %-8s %10s  %s" % (index, status, "%.0f" % elapsed if elapsed is not None else "-",
+                                       describe_build(build[0], build[1])))
+    return all(status == "ok" for status, _ in outcomes.values()) and len(outcomes) == len(builds)
+
+
+def load_traces(paths):
+    records = []
+    for path in paths:
+        with open(path) as trace:
+            records.extend(json.loads(line) for line in trace if line.strip())
+    return records
+
+
+def describe_trace(record):
+    settings = record.get("settings") or {}
+    options = dict(("%s:%s" % (record.get("recipe", "").split("/")[0], key), value == "True")
+                   for key, value in (record.get("options") or {}).items())
+    return "%s %s" % (describe_build(settings, options) or "-", (record.get("package_id") or "")[:8])
+
+
+def write_chrome_trace(records, path):
+    """chrome://tracing and Perfetto format, one row (tid) per configuration"""
+    rows = {}
+    events = []
+    for record in records:
+        row = rows.setdefault(describe_trace(record), len(rows) + 1)
+        events.append({"name": record["phase"], "ph": "X", "pid": 1, "tid": row,
+                       "ts": int(record["start"] * 1e6), "dur": int(record["wall_s"] * 1e6),
+                       "args": {"cpu_s": record["cpu_s"], "read_bytes": record["read_bytes"],
+                                "written_bytes": record["written_bytes"], "status": record["status"]}})
+    events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": row, "args": {"name": configuration}}
+               for configuration, row in rows.items()]
+    with open(path, "w") as output:
+        json.dump({"traceEvents": events}, output)
+
+
+def trace_report(argv):
+    """Aggregates the CONAN_BOOST_TRACE_FILE phase records of a whole matrix:
+    python build.py trace-report trace.jsonl [more.jsonl] [--chrome trace.json] [--top 10]
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="build.py trace-report")
+    parser.add_argument("traces", nargs="+")
+    parser.add_argument("--chrome", help="also write the records in Chrome trace format")
+    parser.add_argument("--top", type=int, default=10, help="slowest configurations to list")
+    args = parser.parse_args(argv)
+    records = load_traces(args.traces)
+    if not records:
+        print("No trace records")
+        return 1
+
+    phases = {}
+    for record in records:
+        phases.setdefault((record["parent"] or "", record["phase"]), []).append(record)
+    print("%-28s %6s %10s %10s %10s %10s %10s %10s" % ("phase", "count", "wall [s]", "mean [s]", "max [s]",
+                                                       "cpu [s]", "read [MB]", "write [MB]"))
+    # Top level phases first, nested ones (b2 within build, ...) are already part of their parent
+    for (parent, phase), items in sorted(phases.items(), key=lambda item: (item[0][0] != "", item[0])):
+        wall = [item["wall_s"] for item in items]
+        print("%-28s %6d %10.1f %10.1f %10.1f %10.1f %10.1f %10.1f" % (
+            "%s/%s" % (parent, phase) if parent else phase, len(items), sum(wall), sum(wall) / len(wall),
+            max(wall), sum(item["cpu_s"] for item in items),
+            sum(item["read_bytes"] or 0 for item in items) / 1e6,
+            sum(item["written_bytes"] or 0 for item in items) / 1e6))
+    failed = sum(1 for record in records if record["status"] != "ok")
+    if failed:
+        print("%d phases failed" % failed)
+
+    configurations = {}
+    for record in records:
+        if not record["parent"]:
+            configurations.setdefault(describe_trace(record), {})[record["phase"]] = record["wall_s"]
+    print("\nSlowest configurations:")
+    print("%10s  %-60s %s" % ("wall [s]", "configuration", "phases [s]"))
+    for configuration, times in sorted(configurations.items(), key=lambda item: -sum(item[1].values()))[:args.top]:
+        print("%10.1f  %-60s %s" % (sum(times.values()), configuration,
+                                     " ".join("%s=%.0f" % item for item in sorted(times.items()))))
+
+    if args.chrome:
+        write_chrome_trace(records, args.chrome)
+        print("\nChrome trace written to %s" % args.chrome)
+    return 0
+
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["trace-report"]:
+        sys.exit(trace_report(sys.argv[2:]))
+
     name = get_name_from_recipe()
     username, channel, version = get_env_vars()
     reference = "{0}/{1}".format(name, version)
@@ -117,10 +430,37 @@ if __name__ == "__main__":
 
     if platform.system() == "Windows":
         filtered_builds = []
-        for settings, options, env_vars, build_requires, reference in builder.items:
+        for settings, options, env_vars, build_requires, build_reference in builder.items:
             if settings["compiler"] != "Visual Studio" or options[name + ":shared"]:
-                filtered_builds.append([settings, options, env_vars, build_requires, reference])
+                filtered_builds.append([settings, options, env_vars, build_requires, build_reference])
         builder.builds = filtered_builds
 
     builder.builds = add_ubitrack_build_options(builder.items)
-    builder.run()
\ No newline at end of file
+    # The ubitrack builds copy the binaries staged by their full counterpart instead of recompiling
+    os.environ.setdefault("CONAN_BOOST_STAGE_REUSE", "1")
+
+    if use_shared_headers():
+        # The recipes pick the Boost-headers reference from these
+        os.environ["CONAN_USERNAME"], os.environ["CONAN_CHANNEL"] = username, channel
+        builder.builds = add_shared_headers_option(builder.items, name)
+        create_header_package(username, channel)
+
+    if use_build_plan():
+        # The whole matrix, every CI page then takes its share of the missing builds
+        builder.builds = plan_builds(builder.items, "{0}@{1}/{2}".format(reference, username, channel))
+        if not builder.items:
+            print("Nothing to build")
+            sys.exit(0)
+
+    parallel = get_parallel_builds()
+    if parallel > 1 and os.getenv("CONAN_UPLOAD"):
+        # The parallel path only builds and tests, ConanMultiPackager does the uploads
+        print("CONAN_UPLOAD is set, building sequentially instead of %d configurations at once" % parallel)
+        parallel = 1
+    if parallel > 1 and not os.getenv("CONAN_DOCKER_IMAGE"):
+        builds = getattr(builder, "builds_in_current_page", builder.items)
+        full_reference = "{0}@{1}/{2}".format(reference, username, channel)
+        if not run_parallel(builds, name, full_reference, parallel, get_job_budget()):
+            sys.exit(1)
+    else:
+        builder.run()
\ No newline at end of file
@@ -2,8 +2,30 @@ from conans import ConanFile
 from conans import tools
 from conans.tools import os_info, SystemPackageTool
 import os, sys
+import csv
+import errno
+import fnmatch
+import functools
+import hashlib
+import json
+import platform
+import re
+import shutil
+import subprocess
 import sysconfig
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+import tarfile
+import time
 from io import StringIO
+from urllib.parse import urlparse
+from urllib.request import url2pathname, urlopen
 
 # From from *1 (see below, b2 --show-libraries), also ordered following linkage order
 # see https://github.com/Kitware/CMake/blob/master/Modules/FindBoost.cmake to know the order
@@ -13,11 +35,476 @@ lib_list = ['math', 'wave', 'container', 'contract', 'exception', 'graph', 'iost
             'atomic', 'filesystem', 'system', 'graph_parallel', 'python',
             'stacktrace', 'test', 'type_erasure']
 
+# Link time dependencies between the compiled libraries of lib_list
+lib_dependencies = {
+    'chrono': ['system'],
+    'contract': ['exception', 'thread'],
+    'coroutine': ['context', 'system'],
+    'fiber': ['context', 'filesystem'],
+    'filesystem': ['system'],
+    'graph': ['regex'],
+    'graph_parallel': ['graph', 'mpi', 'serialization'],
+    'locale': ['thread'],
+    'log': ['atomic', 'date_time', 'filesystem', 'regex', 'system', 'thread'],
+    'mpi': ['serialization'],
+    'random': ['system'],
+    'thread': ['chrono', 'system'],
+    'timer': ['chrono', 'system'],
+    'type_erasure': ['thread'],
+    'wave': ['filesystem', 'serialization'],
+}
+
+# iostreams filters besides zlib: (option, requirement, b2 module, b2 flag disabling the filter)
+compression_backends = [("with_bzip2", "bzip2/1.0.6@camposs/stable", "bzip2", "NO_BZIP2"),
+                        ("with_lzma", "xz_utils/5.2.5@camposs/stable", "lzma", "NO_LZMA"),
+                        ("with_zstd", "zstd/1.4.8@camposs/stable", "zstd", "NO_ZSTD")]
+
+# Defines of the tuning option, used to build the libraries and exported to consumers
+tuning_defines = {
+    'default': [],
+    # Release-grade checks off, lock-free refcounts, grammars shared between threads, bigger regex
+    # memory blocks
+    'throughput': ['BOOST_DISABLE_ASSERTS', 'BOOST_SP_USE_STD_ATOMIC', 'BOOST_SPIRIT_THREADSAFE',
+                   'BOOST_REGEX_MAX_CACHE_BLOCKS=64', 'BOOST_REGEX_BLOCKSIZE=8192'],
+    # Same without the Spirit locking, regex backtracking on the stack instead of the heap
+    'low_latency': ['BOOST_DISABLE_ASSERTS', 'BOOST_SP_USE_STD_ATOMIC', 'BOOST_REGEX_RECURSIVE'],
+}
+
+# Umbrella headers precompiled by the pch option, unless pch_headers lists others. Spirit is left
+# out, it doubles the precompiled header (~220 MB with gcc) for the consumers not using it
+default_pch_headers = ['boost/asio.hpp', 'boost/date_time/posix_time/posix_time.hpp',
+                       'boost/archive/text_oarchive.hpp', 'boost/archive/text_iarchive.hpp']
+# Optimization flags CMake uses per build type, a precompiled header is only valid with the same
+cmake_build_type_flags = {'Debug': ['-g'], 'Release': ['-O3', '-DNDEBUG'],
+                          'RelWithDebInfo': ['-O2', '-g', '-DNDEBUG'], 'MinSizeRel': ['-Os', '-DNDEBUG']}
+
+# Staged binaries named boost_<prefix>* that do not match their library name
+binary_prefixes = [('math_', 'math'), ('wserialization', 'serialization'), ('log_setup', 'log'),
+                   ('unit_test_framework', 'test'), ('prg_exec_monitor', 'test'),
+                   ('test_exec_monitor', 'test'), ('stacktrace_', 'stacktrace'), ('mpi_', 'mpi'),
+                   ('python', 'python'), ('numpy', 'python')]
+
+
+def library_of_binary(filename):
+    """Returns the lib_list entry a staged or packaged binary belongs to, None if unknown"""
+    name = os.path.basename(filename)
+    if name.startswith("lib"):
+        name = name[3:]
+    name = name.split(".")[0].split("-")[0]
+    if not name.startswith("boost_"):
+        return None
+    name = name[len("boost_"):]
+    for prefix, libname in binary_prefixes:
+        if name.startswith(prefix):
+            return libname
+    return name if name in lib_list else None
+
+
+def lib_closure(libnames):
+    """libnames plus all the libraries they link, transitively"""
+    closure = set()
+    pending = list(libnames)
+    while pending:
+        libname = pending.pop()
+        if libname not in closure:
+            closure.add(libname)
+            pending.extend(lib_dependencies.get(libname, []))
+    return closure
+
+
+def b2_compiler_flags(flags):
+    """Translates b2 build flags into the (compile flags, link flags) of a direct compiler call"""
+    cxxflags, linkflags = [], []
+    for flag in flags:
+        name, _, value = flag.partition("=")
+        value = value.strip('"')
+        if name == "cxxflags":
+            cxxflags.extend(value.split())
+        elif name == "linkflags":
+            linkflags.extend(value.split())
+        elif name == "define":
+            cxxflags.append("-D%s" % value)
+        elif name == "address-model":
+            cxxflags.append("-m%s" % value)
+            linkflags.append("-m%s" % value)
+    return cxxflags, linkflags
+
+
+# Header folders of libraries not named like their boost/<name> folder
+header_folders = {'graph_parallel': ['graph/distributed'], 'serialization': ['serialization', 'archive']}
+# Always packaged with minimal_headers, selected by macros bcp-style scanning cannot follow
+base_headers = ['boost/config.hpp', 'boost/version.hpp', 'boost/config', 'boost/preprocessor']
+include_pattern = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]', re.MULTILINE)
+macro_include_pattern = re.compile(r'^\s*#\s*include\s+[A-Z_]', re.MULTILINE)
+
+
+def header_seeds(libnames):
+    """boost/<lib>.hpp and the boost/<lib>/ folder of each library, relative to the include root"""
+    seeds = list(base_headers)
+    for libname in libnames:
+        for folder in header_folders.get(libname, [libname]):
+            seeds.extend(["boost/%s.hpp" % folder, "boost/%s" % folder])
+    return seeds
+
+
+def header_closure(include_root, seeds):
+    """All headers under include_root reachable from seeds (files or folders) through #include,
+    like bcp does. Headers including through a macro take their whole folder with them.
+    """
+    closure = set()
+    pending = []
+
+    def add(relpath):
+        path = os.path.join(include_root, relpath)
+        if os.path.isdir(path):
+            for root, _, filenames in os.walk(path):
+                pending.extend(os.path.relpath(os.path.join(root, name), include_root) for name in filenames)
+        elif os.path.isfile(path):
+            pending.append(os.path.normpath(relpath))
+
+    for seed in seeds:
+        add(seed)
+    while pending:
+        relpath = pending.pop()
+        if relpath in closure:
+            continue
+        closure.add(relpath)
+        with open(os.path.join(include_root, relpath), "rb") as header:
+            content = header.read().decode("latin-1")
+        folder = os.path.dirname(relpath)
+        for delimiter, included in include_pattern.findall(content):
+            if delimiter == '"' and os.path.isfile(os.path.join(include_root, folder, included)):
+                pending.append(os.path.normpath(os.path.join(folder, included)))
+            elif os.path.isfile(os.path.join(include_root, included)):
+                pending.append(os.path.normpath(included))
+        if macro_include_pattern.search(content):
+            # e.g. BOOST_PP_ITERATE(), BOOST_USER_CONFIG, the mpl preprocessed headers
+            stem_folder = os.path.splitext(relpath)[0]
+            if os.path.isdir(os.path.join(include_root, stem_folder)):
+                add(stem_folder)
+            elif os.path.dirname(folder):  # never the whole boost/ tree
+                add(folder)
+    return closure
+
+
+# Libraries the unity_build option keeps compiling file by file: file-local helpers clashing
+# across their sources, per-file flags (atomic's SSE variants, context's assembler) or several
+# binaries built from one src folder. The unity_exclude option adds to them
+unity_excluded_libs = ['atomic', 'container', 'context', 'coroutine', 'fiber', 'graph_parallel', 'iostreams',
+                       'locale', 'log', 'math', 'mpi', 'python', 'serialization', 'stacktrace', 'test', 'thread']
+unity_suffix = ".unity"
+directive_pattern = re.compile(r'^\s*#\s*(include|define|undef)\b\s*(\w*)', re.MULTILINE)
+jam_glob_pattern = re.compile(r'\[\s*glob(?:-tree)?\s+([^\]]+)\]')
+
+
+def unity_sources(lib_folder):
+    """The .cpp files under libs/<name>/src that can share one translation unit, relative to src:
+    named by the Jamfile on a line without properties (<...> conditions), and not defining macros
+    other than BOOST_*_SOURCE ahead of an #include, since the headers were already included by the
+    sources before them. Reads the originals of an already merged folder.
+    """
+    src = os.path.join(lib_folder, "src")
+    jamfiles = [os.path.join(lib_folder, "build", name) for name in ("Jamfile.v2", "Jamfile")]
+    jamfile = next((path for path in jamfiles if os.path.isfile(path)), None)
+    if not jamfile or not os.path.isdir(src):
+        return []
+    with open(jamfile) as jam:
+        lines = jam.read().splitlines()
+    names, globs = set(), []
+    for line in lines:
+        line = line.split("#")[0]
+        if "<" in line:
+            continue
+        for patterns in jam_glob_pattern.findall(line):
+            globs.extend(os.path.normpath(os.path.join(os.path.dirname(jamfile), p)) for p in patterns.split())
+        for token in re.findall(r'[\w./$()-]+', line):
+            token = re.sub(r'^(\.\./)?src/', '', token)
+            names.add(token[:-len(".cpp")] if token.endswith(".cpp") else token)
+
+    sources = []
+    for root, _, filenames in os.walk(src):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            if path.endswith(".cpp" + unity_suffix):
+                path = path[:-len(unity_suffix)]
+            elif not filename.endswith(".cpp") or os.path.isfile(path + unity_suffix):
+                continue
+            relpath = os.path.relpath(path, src).replace(os.sep, "/")
+            if relpath[:-len(".cpp")] not in names and not any(fnmatch.fnmatch(path, g) for g in globs):
+                continue
+            original = path + unity_suffix if os.path.isfile(path + unity_suffix) else path
+            with open(original, "rb") as source:
+                directives = directive_pattern.findall(source.read().decode("latin-1"))
+            last_include = max([i for i, (kind, _) in enumerate(directives) if kind == "include"] or [-1])
+            if not any(kind != "include" and not re.match(r'BOOST_\w*_SOURCE$', name)
+                       for kind, name in directives[:last_include]):
+                sources.append(relpath)
+    return sorted(sources)
+
+
+def write_unity_sources(src, sources):
+    """Moves the sources aside as *.cpp.unity, the first one becomes the translation unit including
+    all of them and the others are left empty. Moving keeps hardlinked trees intact.
+    """
+    holder = os.path.join(src, sources[0])
+    for relpath in sources:
+        path = os.path.join(src, relpath)
+        os.replace(path, path + unity_suffix)
+        with open(path, "w") as stub:
+            stub.write("// Compiled as part of %s (unity_build option)\n" % sources[0])
+    with open(holder, "w") as unity:
+        unity.write("// Unity translation unit (unity_build option), the original sources are *.cpp%s\n" % unity_suffix)
+        for relpath in sources:
+            included = os.path.relpath(os.path.join(src, relpath), os.path.dirname(holder)).replace(os.sep, "/")
+            unity.write('#include "%s%s"\n' % (included, unity_suffix))
+
+
+def restore_unity_sources(src, sources):
+    for relpath in sources:
+        path = os.path.join(src, relpath)
+        if os.path.isfile(path + unity_suffix):
+            os.replace(path + unity_suffix, path)
+
+
+def copy_file_or_link(src, dst):
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+# Linux ioctl cloning a file, supported by btrfs, XFS and overlayfs on top of them
+FICLONE = 0x40049409
+# Errors of a filesystem, or a pair of them, that cannot reflink resp. hardlink at all
+unsupported_link_errors = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.EXDEV, errno.ENOSYS, errno.EPERM)
+
+
+def package_strategies(hardlinks=False):
+    """The ways package_file() may try, cheapest first. A hardlink shares the inode with its
+    source, rewriting that in place (b2's stage, replace_in_file) changes the package too
+    """
+    strategies = ["reflink"] if fcntl is not None and sys.platform.startswith("linux") else []
+    return strategies + (["hardlink"] if hardlinks else []) + ["copy"]
+
+
+def package_file(src, dst, strategies):
+    """Puts src at dst with the first of strategies (see package_strategies()) that works, symlinks
+    are recreated. Returns the method used. A strategy the filesystem does not support is dropped
+    from strategies, the following files go straight to the next one.
+    """
+    folder = os.path.dirname(dst)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dst)
+        return "symlink"
+    if "reflink" in strategies:
+        try:
+            with open(src, "rb") as source, open(dst, "wb") as target:
+                fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+            shutil.copystat(src, dst)
+            return "reflink"
+        except (IOError, OSError) as exc:
+            os.unlink(dst)
+            if exc.errno in unsupported_link_errors:
+                strategies.remove("reflink")
+    if "hardlink" in strategies:
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except (AttributeError, OSError) as exc:  # other filesystem, no hardlink support
+            if getattr(exc, "errno", None) in unsupported_link_errors + (None,):
+                strategies.remove("hardlink")
+    shutil.copy2(src, dst)
+    return "copy"
+
+# Upstream locations of the release archive, formatted with (version, archive name)
+source_urls = ["https://dl.bintray.com/boostorg/release/%s/source/%s",
+               "https://boostorg.jfrog.io/artifactory/main/release/%s/source/%s"]
+# sha256 of boost_1_75_0.tar.gz, verifies every fetch and keys the local archive cache
+source_sha256 = "aeb26f80e80945e82ee93e5939baebdca47b9dee80a07d3144be1e1a6a66dd6a"
+# Subfolders of libs/<name> that are never needed to build the libraries
+unused_source_dirs = ["doc", "test", "example", "examples"]
+# ...except these, b2 configuration checks include them
+required_source_dirs = ["libs/config/test"]
+
+
+# Libraries whose translation units (Spirit grammars, heavy templates) need far more memory
+heavy_libs = ['log', 'wave', 'serialization', 'graph', 'locale']
+
+
+def available_memory_mb():
+    """Memory available to the build in MB, honouring cgroup limits, None if unknown"""
+    if os.environ.get("CONAN_BOOST_MEMORY_LIMIT_MB"):
+        return int(os.environ["CONAN_BOOST_MEMORY_LIMIT_MB"])
+    available = None
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) // 1024
+    except (IOError, OSError, ValueError):
+        pass
+    # CI runners are usually containers limited below the host memory
+    for limit_file, usage_file in (("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+                                   ("/sys/fs/cgroup/memory/memory.limit_in_bytes",
+                                    "/sys/fs/cgroup/memory/memory.usage_in_bytes")):
+        try:
+            with open(limit_file) as limit, open(usage_file) as usage:
+                free = (int(limit.read().strip()) - int(usage.read().strip())) // (1024 * 1024)
+        except (IOError, OSError, ValueError):  # "max", not mounted, ...
+            continue
+        available = free if available is None else min(available, free)
+        break
+    if available is None and sys.platform == "darwin":
+        try:
+            available = int(subprocess.check_output(["sysctl", "-n", "hw.memsize"])) // (1024 * 1024)
+        except (OSError, subprocess.CalledProcessError, ValueError):
+            pass
+    return available
+
+
+def recipe_digest():
+    """sha256 of this recipe and of the exported patches and scripts, which change the binaries
+    without showing in the b2 flags
+    """
+    recipe_folder = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(recipe_folder, "conanfile.py")]
+    for folder in ("patches", "scripts"):
+        for root, _, filenames in os.walk(os.path.join(recipe_folder, folder)):
+            paths.extend(os.path.join(root, name) for name in filenames if not name.endswith(".pyc"))
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, recipe_folder).replace(os.sep, "/").encode("utf-8"))
+        with open(path, "rb") as content:
+            digest.update(hashlib.sha256(content.read()).digest())
+    return digest.hexdigest()
+
+
+def env_flag(name):
+    return os.environ.get(name, "0").lower() in ("1", "true", "yes")
+
+
+def lean_sources_enabled():
+    """CONAN_BOOST_LEAN_SOURCES=1 extracts a pruned tree per configuration in build()"""
+    return env_flag("CONAN_BOOST_LEAN_SOURCES")
+
+
+def lean_source_filter(folder_name, skipped_libs):
+    """Returns a predicate on archive member names dropping the top level docs, the docs, tests
+    and examples of every library and the libs/<name> trees of skipped_libs, except for their
+    build/ folder: the Jamroot lists the libraries from libs/*/build/Jamfile*, and rejects
+    --without-<name> of a library missing there
+    """
+    skipped_libs = set(skipped_libs)
+
+    def keep(member_name):
+        parts = member_name.split("/")
+        if parts[0] == folder_name:
+            parts = parts[1:]
+        if parts[:1] == ["doc"]:
+            return False
+        if len(parts) < 2 or parts[0] != "libs":
+            return True
+        if parts[1] in skipped_libs:
+            return len(parts) == 2 or parts[2] in ("", "build")
+        if len(parts) >= 3 and parts[2] in unused_source_dirs:
+            return "/".join(parts[:3]) in required_source_dirs
+        return True
+    return keep
+
+
+def rusage_totals():
+    """(CPU seconds, bytes read, bytes written) of this process and its waited for children"""
+    if resource is None:
+        times = os.times()
+        return times[0] + times[1] + times[2] + times[3], None, None
+    cpu, blocks_in, blocks_out = 0.0, 0, 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        cpu += usage.ru_utime + usage.ru_stime
+        blocks_in += usage.ru_inblock
+        blocks_out += usage.ru_oublock
+    # Blocks of 512 bytes actually read from or written to storage, page cache hits do not count
+    return cpu, blocks_in * 512, blocks_out * 512
+
+
+def traced(phase):
+    """Appends wall time, CPU time (b2 and the compilers included) and block I/O of the decorated
+    recipe method to CONAN_BOOST_TRACE_FILE as a JSON line, see write_trace()
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not os.environ.get("CONAN_BOOST_TRACE_FILE"):
+                return method(self, *args, **kwargs)
+            stack = self.__dict__.setdefault("_trace_stack", [])
+            parent = stack[-1] if stack else None
+            stack.append(phase)
+            start = time.time()
+            cpu, read, written = rusage_totals()
+            status = "failed"
+            try:
+                result = method(self, *args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                stack.pop()
+                end_cpu, end_read, end_written = rusage_totals()
+                self.write_trace({"phase": phase, "parent": parent, "status": status, "start": round(start, 3),
+                                  "wall_s": round(time.time() - start, 3), "cpu_s": round(end_cpu - cpu, 3),
+                                  "read_bytes": end_read - read if read is not None else None,
+                                  "written_bytes": end_written - written if written is not None else None})
+        return wrapper
+    return decorator
+
+
+def tar_member_within(member, folder_name):
+    """Whether member, and the target of a link member, stay inside folder_name"""
+    def within(path):
+        parts = os.path.normpath(path).replace(os.sep, "/").split("/")
+        return not os.path.isabs(path) and parts[0] == folder_name and ".." not in parts
+    if not (member.isfile() or member.isdir() or member.issym() or member.islnk()):
+        return False
+    if member.issym():
+        return within(member.name) and within(os.path.join(os.path.dirname(member.name), member.linkname))
+    if member.islnk():
+        return within(member.name) and within(member.linkname)
+    return within(member.name)
+
+
+class HashingReader(object):
+    """File-like wrapper computing the sha256 of everything read, optionally copying it to tee"""
+
+    def __init__(self, stream, tee=None):
+        self.stream = stream
+        self.tee = tee
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+        if self.tee is not None:
+            self.tee.write(data)
+        return data
+
+    def drain(self):
+        while self.read(1 << 20):
+            pass
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
 class BoostConan(ConanFile):
     name = "Boost"
     version = "1.75.0"
     settings = "os", "arch", "compiler", "build_type"
     folder_name = "boost_%s" % version.replace(".", "_")
+    archive_name = "%s.tar.gz" % folder_name
     # The current python option requires the package to be built locally, to find default Python
     # implementation
     options = {
@@ -26,6 +513,22 @@ class BoostConan(ConanFile):
         "fPIC": [True, False],
         "skip_lib_rename": [True, False],
         "magic_autolink": [True, False], # enables BOOST_ALL_NO_LIB
+        "compiler_launcher": ["none", "ccache", "sccache"], # or CONAN_BOOST_COMPILER_LAUNCHER
+        "lto": ["none", "full", "thin"], # thin needs clang
+        "pgo": [True, False], # trains with test_package/benchmark.cpp
+        "tuning": list(tuning_defines), # defines of the libraries and their consumers
+        "slim_shared": [True, False], # hidden visibility and section GC of the shared libraries
+        "split_debug": [True, False], # DWARF moved to CONAN_BOOST_DEBUG_STORE (required)
+        "with_bzip2": [True, False], # iostreams filters, besides zlib
+        "with_lzma": [True, False],
+        "with_zstd": [True, False],
+        "shared_headers": [True, False], # headers from the Boost-headers package (headers/conanfile.py)
+        "minimal_headers": [True, False], # package only the headers the libraries need
+        "pch": [True, False], # precompiled headers for consumers, see BoostPCH.cmake
+        "pch_headers": "ANY", # with pch, e.g. "boost/asio.hpp,boost/beast.hpp"
+        "header_only_libs": "ANY", # with minimal_headers, e.g. "asio,spirit,algorithm"
+        "unity_build": [True, False], # one translation unit per library, see unity_excluded_libs
+        "unity_exclude": "ANY", # with unity_build, e.g. "regex,filesystem"
         }
     options.update({"without_%s" % libname: [True, False] for libname in lib_list})
 
@@ -34,6 +537,22 @@ class BoostConan(ConanFile):
         "fPIC=False",
         "skip_lib_rename=True",
         "magic_autolink=False",
+        "compiler_launcher=none",
+        "lto=none",
+        "pgo=False",
+        "tuning=default",
+        "slim_shared=False",
+        "split_debug=False",
+        "with_bzip2=False",
+        "with_lzma=False",
+        "with_zstd=False",
+        "shared_headers=False",
+        "minimal_headers=False",
+        "pch=False",
+        "pch_headers=",
+        "header_only_libs=",
+        "unity_build=False",
+        "unity_exclude=",
         ]
     default_options.extend(["without_%s=False" % libname for libname in lib_list if (libname != "python" or libname != "fiber")])
     default_options.append("without_python=True")
@@ -45,7 +564,7 @@ class BoostConan(ConanFile):
     license="Boost Software License - Version 1.0. http://www.boost.org/LICENSE_1_0.txt"
     short_paths = True
 
-    exports = ['patches/*']
+    exports = ['patches/*', 'scripts/*', 'test_package/benchmark.cpp']
 
     def config_options(self):
         """ First configuration step. Only settings are defined. Options can be removed
@@ -53,6 +572,18 @@ class BoostConan(ConanFile):
         """
         if self.settings.compiler == "Visual Studio":
             self.options.remove("fPIC")
+            # b2 drives cl through response files and vcvars, a launcher cannot be injected
+            self.options.remove("compiler_launcher")
+            self.options.remove("lto")
+            self.options.remove("pgo")
+            self.options.remove("slim_shared")
+        if self.settings.compiler != "gcc":
+            # cl precompiled headers are tied to the object file built with them, clang validates
+            # the absolute header paths recorded in the .pch, gone outside this build folder
+            self.options.remove("pch")
+        if self.settings.os not in ("Linux", "Android", "FreeBSD"):
+            # objcopy and gnu-debuglink need ELF binaries
+            self.options.remove("split_debug")
 
     @property
     def zip_bzip2_requires_needed(self):
@@ -71,13 +602,54 @@ class BoostConan(ConanFile):
             self.options.remove("shared")
             self.options.remove("fPIC")
             self.options.remove("python")
+        if not self.options.get_safe("shared"):
+            self.options.remove("slim_shared")
+
+        if self.options.header_only and self.options.minimal_headers and not self.header_only_libs:
+            raise Exception("header_only with minimal_headers packages the header_only_libs closure, "
+                            "list the libraries there, e.g. header_only_libs=\"lambda,asio\"")
+        if self.options.header_only:
+            self.options.remove("shared_headers")
+            # Precompiled headers depend on the compiler and flags, header-only packages have none
+            self.options.remove("pch")
+            self.options.remove("unity_build")
+            self.options.remove("unity_exclude")
+        elif self.options.shared_headers:
+            if self.options.minimal_headers:
+                raise Exception("minimal_headers has no effect with shared_headers, the headers are not packaged")
+            # One header package for all the binary variants, instead of a copy in each of them
+            self.requires("Boost-headers/%s@%s/%s" % (self.version, os.getenv("CONAN_USERNAME", "camposs"),
+                                                      os.getenv("CONAN_CHANNEL", "stable")))
+
+        if not self.options.header_only:
+            # Keep the libraries the enabled ones link against
+            for libname in sorted(lib_closure(self.enabled_libs) - set(self.enabled_libs)):
+                self.output.info("Enabling %s, required by the enabled libraries" % libname)
+                setattr(self.options, "without_%s" % libname, False)
+
+        if self.options.get_safe("lto") == "thin" and "clang" not in str(self.settings.compiler):
+            raise Exception("lto=thin is only supported by clang")
+        if self.options.get_safe("lto") not in (None, "none") and "clang" in str(self.settings.compiler) \
+                and not self.options.header_only and not self.options.shared:
+            # Bitcode-only objects, unusable without an LTO linker plugin, unlike gcc's fat objects
+            raise Exception("lto with clang needs shared=True, static libraries would only hold LLVM bitcode")
+        if self.options.get_safe("pgo") and (tools.cross_building(self.settings) or self.settings.os == "iOS"):
+            raise Exception("pgo needs to run the training workload on the build machine")
 
         if self.zip_bzip2_requires_needed:
-            # if self.settings.os == "Linux" or self.settings.os == "Macos":
-            #     self.requires("bzip2/1.0.6@camposs/stable")
-            #     self.options["bzip2"].shared = self.options.shared
             self.requires("zlib/1.2.11@camposs/stable")
             self.options["zlib"].shared = self.options.shared
+            for _, reference, _, _ in self.enabled_compression_backends:
+                self.requires(reference)
+                self.options[reference.split("/")[0]].shared = self.options.shared
+        else:
+            for option, _, _, _ in compression_backends:
+                self.options.remove(option)
+
+    @property
+    def enabled_compression_backends(self):
+        """compression_backends entries enabled by their option"""
+        return [backend for backend in compression_backends if self.options.get_safe(backend[0])]
 
     def system_requirements(self):
         if not self.options.without_python:
@@ -105,50 +677,237 @@ class BoostConan(ConanFile):
 
     def package_id(self):
         if self.options.header_only:
-            self.info.header_only()
-
+            # Like self.info.header_only(), but the header selection stays in the id
+            self.info.settings.clear()
+            self.info.requires.clear()
+            kept = ["header_only", "minimal_headers", "header_only_libs"] if self.options.minimal_headers \
+                else ["header_only", "minimal_headers"]
+            for name, _ in self.info.options.as_list():
+                if ":" not in name and name not in kept:
+                    delattr(self.info.options, name)
+            return
+        if self.options.get_safe("compiler_launcher") is not None:
+            # A compiler cache does not change the binaries
+            del self.info.options.compiler_launcher
+        if not self.options.minimal_headers:
+            del self.info.options.header_only_libs
+        if not self.options.unity_build:
+            del self.info.options.unity_exclude
+        if not self.options.get_safe("pch"):  # also removed for every compiler but gcc
+            del self.info.options.pch_headers
+
+    @traced("source")
     def source(self):
-        zip_name = "%s.zip" % self.folder_name if sys.platform == "win32" else "%s.tar.gz" % self.folder_name
-        url = "https://dl.bintray.com/boostorg/release/%s/source/%s" % (self.version, zip_name)
-        self.output.info("Downloading %s..." % url)
-        tools.download(url, zip_name)
-        tools.unzip(zip_name)
-        os.unlink(zip_name)
+        if lean_sources_enabled():
+            # The source folder is shared by all configurations, the pruned tree is extracted per
+            # configuration in build()
+            self.fetch_source()
+            return
+        self.fetch_source(self.source_folder)
+
+    ##################### SOURCE CACHE METHODS ###########################
+
+    @property
+    def boost_cache_folder(self):
+        """Persistent folder shared by all configurations and recipe revisions,
+        CONAN_BOOST_CACHE_DIR or ~/.conan/boost_cache by default
+        """
+        folder = os.environ.get("CONAN_BOOST_CACHE_DIR")
+        if not folder:
+            home = os.environ.get("CONAN_USER_HOME", os.path.expanduser("~"))
+            folder = os.path.join(home, ".conan", "boost_cache")
+        return folder
+
+    @property
+    def cached_archive(self):
+        return os.path.join(self.boost_cache_folder, "sources", self.version, source_sha256, self.archive_name)
+
+    def source_mirrors(self):
+        """Local directories, files, file:// or http(s):// URLs from CONAN_BOOST_SOURCE_MIRRORS
+        (comma separated) are tried before the upstream download locations
+        """
+        mirrors = [m.strip() for m in os.environ.get("CONAN_BOOST_SOURCE_MIRRORS", "").split(",") if m.strip()]
+        return mirrors + [url % (self.version, self.archive_name) for url in source_urls]
+
+    @traced("fetch_source")
+    def fetch_source(self, destination=None, keep=None):
+        """Puts the release archive in the archive cache and extracts the members accepted by keep
+        into destination. Nothing is extracted before the archive matched the pinned sha256, the
+        cached archive is verified again before every use
+        """
+        archive = self.cached_archive
+        if os.path.isfile(archive):
+            self.output.info("Using cached %s" % archive)
+            try:
+                self._verify_archive(open(archive, "rb"))
+            except Exception as exc:
+                self.output.warn("Discarding cached archive: %s" % exc)
+                os.unlink(archive)
+        if not os.path.isfile(archive):
+            self._download_archive(archive)
+        if destination is not None:
+            self._extract_archive(archive, destination, keep)
+
+    def _download_archive(self, archive):
+        tools.mkdir(os.path.dirname(archive))
+        # Write next to the final location and move it in place once verified, so concurrent
+        # builds never see a partial archive
+        partial = "%s.%s.part" % (archive, os.getpid())
+        for mirror in self.source_mirrors():
+            self.output.info("Fetching %s from %s..." % (self.archive_name, mirror))
+            try:
+                with open(partial, "wb") as tee:
+                    self._verify_archive(self._open_mirror(mirror), tee)
+            except Exception as exc:
+                self.output.warn("Could not fetch %s from %s: %s" % (self.archive_name, mirror, exc))
+                if os.path.exists(partial):
+                    os.unlink(partial)
+                continue
+            os.replace(partial, archive)
+            return
+        raise Exception("Could not fetch %s (sha256 %s) from any mirror" % (self.archive_name, source_sha256))
+
+    def _open_mirror(self, location):
+        if location.startswith("file://"):
+            path = url2pathname(urlparse(location).path)
+        elif "://" in location:
+            if location.endswith("/"):
+                location += self.archive_name
+            return urlopen(location, timeout=60)
+        else:
+            path = location
+        if os.path.isdir(path):
+            path = os.path.join(path, self.archive_name)
+        return open(path, "rb")
+
+    def _verify_archive(self, stream, tee=None):
+        reader = HashingReader(stream, tee)
+        try:
+            reader.drain()
+        finally:
+            stream.close()
+        if reader.hexdigest() != source_sha256:
+            raise Exception("sha256 mismatch, got %s" % reader.hexdigest())
+
+    def _extract_archive(self, archive, destination, keep):
+        """Streams the verified archive into destination, only members within folder_name"""
+        # Python's "data" filter also refuses special files and links leaving the destination
+        options = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+        with tarfile.open(archive, mode="r|gz") as tar:
+            for member in tar:
+                if not tar_member_within(member, self.folder_name):
+                    raise Exception("%s has a member outside %s: %s" % (archive, self.folder_name, member.name))
+                if keep is None or keep(member.name):
+                    tar.extract(member, destination, **options)
+
+    @traced("extract_lean_source")
+    def extract_lean_source(self, destination):
+        """Extracts the tree without docs, tests, examples and the disabled libraries"""
+        skipped = [libname for libname in lib_list if getattr(self.options, "without_%s" % libname)]
+        self.output.info("Extracting sources without %s" % ", ".join(skipped))
+        self.fetch_source(destination, lean_source_filter(self.folder_name, skipped))
 
     ##################### BUILDING METHODS ###########################
 
+    @traced("build")
     def build(self):
+        if lean_sources_enabled() and not os.path.isdir(os.path.join(self.source_folder, self.folder_name)):
+            self.extract_lean_source(self.source_folder)
+
         if self.options.header_only:
             self.output.warn("Header only package, skipping build")
             return
 
-        if os_info.is_windows:
-            tools.patch(base_path=os.path.join(self.build_folder, self.folder_name), patch_file="patches/fix_pcl_1.11_compiler_error_cuda.patch", strip=2)
-        # fix for change to boost quaternion (made members private, but we want to subclass it and access it's members)
-        # somehow this patch does not work :(((
-        # tools.patch(base_path=os.path.join(self.build_folder, self.folder_name), patch_file='patches/quaternion_make_members_protected.patch', strip=1)
+        if self.options.get_safe("split_debug"):
+            # Fail before b2 rather than in package()
+            self.require_debug_store()
+        self.apply_patches()
+        self.apply_unity_build()
 
-        # for now just replace the hopefully unique string in this file ..
-        tools.replace_in_file(os.path.join(self.build_folder, self.folder_name, "boost", "math", "quaternion.hpp"), 
-            """        private:
-           T a, b, c, d;""",
-            """        protected:
-           T a, b, c, d;""")
-
-        # tools.patch(base_path=os.path.join(self.build_folder, self.folder_name), patch_file='patches/fix_cond_waitfor_fibers01.patch', strip=1)
-
-        # if self.settings.compiler == "Visual Studio":
-        #     tools.replace_in_file(os.path.join(self.source_folder, self.folder_name, "boost/config/compiler/visualc.hpp"), 
-        #         "#if (_MSC_VER > 1910)", '''#if (_MSC_VER > 1915)''')
-
-        b2_exe = self.bootstrap()
         flags = self.get_build_flags()
         # Help locating bzip2 and zlib
         self.create_user_config_jam(self.build_folder)
 
+        # Profile guided binaries depend on the training run, they are never shared
+        stage_reuse = env_flag("CONAN_BOOST_STAGE_REUSE") and not self.options.get_safe("pgo")
+        stage_cache = self.stage_cache_folder(flags) if stage_reuse else None
+        partial_build = False
+        if stage_cache:
+            missing = self.restore_stage(stage_cache)
+            if not missing:
+                self.output.info("All libraries reused from %s, skipping b2" % stage_cache)
+                if self.options.get_safe("pch"):
+                    self.build_pch()
+                return
+            partial_build = len(missing) < len(self.enabled_libs)
+            if partial_build:
+                self.output.info("Reused stage from %s, building %s" % (stage_cache, ", ".join(missing)))
+                flags = [flag for flag in flags if not flag.startswith("--without-")]
+                flags.extend("--with-%s" % libname for libname in missing)
+
+        self.drop_stale_objects(flags)
+        b2_exe = self.bootstrap()
+        if os.path.exists(self.build_profile_log):
+            os.unlink(self.build_profile_log)
+        try:
+            # The sibling variants are handed over through the stage cache. Only Release and Debug
+            # are siblings, RelWithDebInfo and MinSizeRel share variant=release with Release
+            if stage_cache and not partial_build and env_flag("CONAN_BOOST_MULTI_VARIANT") \
+                    and self.settings.compiler != "Visual Studio" \
+                    and str(self.settings.build_type) in ("Release", "Debug"):
+                self.build_multi_variant(b2_exe)
+            elif self.options.get_safe("pgo"):
+                self.build_pgo(b2_exe, flags)
+            else:
+                self.run_b2_phased(b2_exe, flags)
+        finally:
+            if self.build_profiling:
+                self.write_build_profile()
+
+        if stage_cache:
+            self.publish_stage(stage_cache)
+        if self.options.get_safe("pch"):
+            self.build_pch()
+
+    def b2_job_counts(self):
+        """Returns the b2 -j for regular and for heavy_libs translation units.
+        CONAN_BOOST_JOB_POLICY=memory (default) fits the jobs into the available memory at
+        CONAN_BOOST_MEMORY_PER_JOB_MB (1024) resp. CONAN_BOOST_MEMORY_PER_HEAVY_JOB_MB (3072)
+        per job, CONAN_BOOST_JOB_POLICY=cpu uses one job per core
+        """
+        jobs = self.b2_jobs
+        if os.environ.get("CONAN_BOOST_JOB_POLICY", "memory") == "cpu":
+            return jobs, jobs
+        memory = available_memory_mb()
+        if memory is None:
+            self.output.warn("Could not determine the available memory, using -j%s" % jobs)
+            return jobs, jobs
+        per_job = int(os.environ.get("CONAN_BOOST_MEMORY_PER_JOB_MB", "1024"))
+        per_heavy_job = int(os.environ.get("CONAN_BOOST_MEMORY_PER_HEAVY_JOB_MB", "3072"))
+        regular, heavy = max(1, min(jobs, memory // per_job)), max(1, min(jobs, memory // per_heavy_job))
+        self.output.info("%d MB available: -j%d, -j%d for %s" % (memory, regular, heavy, ", ".join(self.heavy_libs)))
+        return regular, heavy
+
+    @property
+    def heavy_libs(self):
+        names = os.environ.get("CONAN_BOOST_HEAVY_LIBS")
+        return [n.strip() for n in names.split(",") if n.strip()] if names is not None else heavy_libs
+
+    def run_b2_phased(self, b2_exe, flags):
+        """Builds the heavy libraries at reduced parallelism first, then the rest at full width"""
+        regular_jobs, heavy_jobs = self.b2_job_counts()
+        requested = [flag[len("--with-"):] for flag in flags if flag.startswith("--with-")] or self.enabled_libs
+        heavy = [libname for libname in requested if libname in self.heavy_libs]
+        if heavy and heavy_jobs < regular_jobs:
+            selection = [flag for flag in flags if not flag.startswith(("--with-", "--without-"))]
+            self.run_b2(b2_exe, selection + ["--with-%s" % libname for libname in heavy], heavy_jobs)
+        self.run_b2(b2_exe, flags, regular_jobs)
+
+    @traced("b2")
+    def run_b2(self, b2_exe, flags, jobs=None):
         # JOIN ALL FLAGS
         b2_flags = " ".join(flags)
-        full_command = "%s %s -j%s --abbreviate-paths -d2" % (b2_exe, b2_flags, tools.cpu_count())
+        full_command = "%s %s -j%s --abbreviate-paths -d2" % (b2_exe, b2_flags, jobs or self.b2_jobs)
         # -d2 is to print more debug info and avoid travis timing out without output
         sources = os.path.join(self.source_folder, self.folder_name)
         full_command += ' --debug-configuration --build-dir="%s"' % self.build_folder
@@ -160,9 +919,427 @@ class BoostConan(ConanFile):
                 with tools.environment_append({"BOOST_BUILD_PATH": self.build_folder}):
                     # To show the libraries *1
                     # self.run("%s --show-libraries" % b2_exe)
-                    self.run(full_command)
+                    with tools.environment_append(self.compiler_launcher_env()):
+                        launcher_stats = self.compiler_launcher_stats()
+                        try:
+                            self.run(full_command)
+                        finally:
+                            self.report_compiler_launcher_stats(launcher_stats)
+
+    def build_multi_variant(self, b2_exe):
+        """Compiles the Debug/Release x static/shared siblings of this configuration in a single
+        b2 run, then stages each of them with a b2 run that only links the shared object files.
+        The siblings' stages are published to the stage cache for their own configurations.
+        """
+        def common(flags):
+            return [flag for flag in flags if not flag.startswith(("link=", "variant=", "--layout="))]
+
+        current = (str(self.settings.build_type), bool(self.options.shared))
+        base = common(self.get_build_flags())
+        variants = []
+        # zlib follows the shared option, the other link type would link the wrong zlib package
+        links = [current[1]] if self.zip_bzip2_requires_needed else [False, True]
+        for build_type in ("Release", "Debug"):
+            for shared in links:
+                flags = self.get_build_flags(build_type, shared)
+                # Only siblings that differ in nothing but variant and link share object files
+                if common(flags) == base:
+                    variants.append((build_type, shared, flags))
+
+        scratch = os.path.join(self.build_folder, "multi-variant-stage")
+        # Distinct tagged names let all variants be staged side by side
+        self.run_b2_phased(b2_exe, base + ["variant=%s" % ",".join(sorted(set(v[0].lower() for v in variants))),
+                                    "link=%s" % ",".join(sorted(set("shared" if v[1] else "static" for v in variants))),
+                                    "--layout=tagged", '--stagedir="%s"' % scratch])
+        for build_type, shared, flags in variants:
+            if (build_type, shared) == current:
+                self.run_b2(b2_exe, flags)
+                continue
+            stagedir = os.path.join(self.build_folder, "stage-%s-%s" % (build_type.lower(), "shared" if shared else "static"))
+            self.run_b2(b2_exe, flags + ['--stagedir="%s"' % stagedir])
+            self.publish_stage(self.stage_cache_folder(flags, build_type), os.path.join(stagedir, "lib"))
+            self.output.info("Published %s shared=%s stage" % (build_type, shared))
+
+    ##################### INCREMENTAL BUILD METHODS ###########################
+
+    @property
+    def patch_stamp(self):
+        return os.path.join(self.build_folder, self.folder_name, ".conan_patches")
+
+    def apply_patches(self):
+        """Applies each source patch once, later build() runs in the same folder skip the
+        patches listed in the stamp
+        """
+        applied = tools.load(self.patch_stamp).split() if os.path.isfile(self.patch_stamp) else []
+        patches = []
+        if os_info.is_windows:
+            patches.append(("fix_pcl_1.11_compiler_error_cuda", lambda: tools.patch(
+                base_path=os.path.join(self.build_folder, self.folder_name),
+                patch_file="patches/fix_pcl_1.11_compiler_error_cuda.patch", strip=2)))
+        # fix for change to boost quaternion (made members private, but we want to subclass it and access it's members)
+        # somehow this patch does not work :(((
+        # tools.patch(base_path=os.path.join(self.build_folder, self.folder_name), patch_file='patches/quaternion_make_members_protected.patch', strip=1)
+
+        # for now just replace the hopefully unique string in this file ..
+        patches.append(("quaternion_protected_members", lambda: tools.replace_in_file(
+            os.path.join(self.build_folder, self.folder_name, "boost", "math", "quaternion.hpp"),
+            """        private:
+           T a, b, c, d;""",
+            """        protected:
+           T a, b, c, d;""")))
+
+        # tools.patch(base_path=os.path.join(self.build_folder, self.folder_name), patch_file='patches/fix_cond_waitfor_fibers01.patch', strip=1)
+
+        # if self.settings.compiler == "Visual Studio":
+        #     tools.replace_in_file(os.path.join(self.source_folder, self.folder_name, "boost/config/compiler/visualc.hpp"), 
+        #         "#if (_MSC_VER > 1910)", '''#if (_MSC_VER > 1915)''')
+
+        for name, apply_patch in patches:
+            if name in applied:
+                self.output.info("Patch %s already applied" % name)
+                continue
+            apply_patch()
+            applied.append(name)
+            tools.save(self.patch_stamp, "\n".join(applied))
+
+    def drop_stale_objects(self, flags):
+        """Free features (cxxflags, linkflags, define) and the compiler command in user-config.jam
+        do not change b2's object paths, so b2 would keep the objects built with the former ones.
+        Removes the b2 build tree when they changed since the last build in this folder.
+        """
+        stamp = os.path.join(self.build_folder, "b2_inputs.stamp")
+        inputs = [flag for flag in flags if flag.startswith(("cxxflags=", "linkflags=", "define="))]
+        inputs.append(tools.load(os.path.join(self.build_folder, "user-config.jam")))
+        if os.path.isfile(self.unity_stamp):
+            # Restored originals are older than the objects built from their unity translation unit
+            inputs.append(tools.load(self.unity_stamp))
+        current = "\n".join(inputs)
+        if os.path.isfile(stamp) and tools.load(stamp) != current:
+            self.output.info("Compiler flags changed since the last build, rebuilding all objects")
+            shutil.rmtree(os.path.join(self.build_folder, "boost", "bin.v2"), ignore_errors=True)
+        tools.save(stamp, current)
+
+    @property
+    def unity_stamp(self):
+        return os.path.join(self.build_folder, self.folder_name, ".conan_unity")
+
+    @property
+    def unity_libs(self):
+        """Libraries merged by unity_build, independent of the without_* options"""
+        if not self.options.get_safe("unity_build"):
+            return []
+        excluded = set(unity_excluded_libs)
+        excluded.update(name.strip() for name in str(self.options.unity_exclude).replace(",", " ").split())
+        return [libname for libname in sorted(lib_list) if libname not in excluded]
+
+    def apply_unity_build(self):
+        """Merges the sources of each unity_libs library into one translation unit. The plan is
+        stamped like the patches: an unchanged plan leaves the sources alone, a changed one restores
+        the originals of the former plan first
+        """
+        libs_folder = os.path.join(self.build_folder, self.folder_name, "libs")
+        plan = {}
+        for libname in self.unity_libs:
+            sources = unity_sources(os.path.join(libs_folder, libname))
+            if len(sources) > 1:
+                plan[libname] = sources
+        current = json.dumps(plan, indent=1, sort_keys=True)
+        previous = tools.load(self.unity_stamp) if os.path.isfile(self.unity_stamp) else None
+        if current == previous or (previous is None and not plan):
+            return
+        for libname, sources in json.loads(previous or "{}").items():
+            restore_unity_sources(os.path.join(libs_folder, libname, "src"), sources)
+        for libname, sources in sorted(plan.items()):
+            write_unity_sources(os.path.join(libs_folder, libname, "src"), sources)
+            self.output.info("Unity build of %s: %d sources" % (libname, len(sources)))
+        tools.save(self.unity_stamp, current)
+
+    ##################### PGO METHODS ###########################
+
+    @traced("pgo")
+    def build_pgo(self, b2_exe, flags):
+        """Two stage profile guided optimization: an instrumented build, a training run of
+        test_package/benchmark.cpp against it, and an optimized rebuild from scratch
+        """
+        profile_dir = os.path.join(self.build_folder, "pgo-profile")
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        tools.mkdir(profile_dir)
+        if "clang" in str(self.settings.compiler):
+            profdata = os.path.join(profile_dir, "boost.profdata")
+            generate = ["-fprofile-instr-generate"]
+            use = ["-fprofile-instr-use=%s" % profdata]
+        else:
+            generate = ["-fprofile-generate=%s" % profile_dir, "-fprofile-update=prefer-atomic"]
+            use = ["-fprofile-use=%s" % profile_dir, "-fprofile-correction", "-Wno-missing-profile"]
+
+        def with_flags(extra):
+            return flags + ['cxxflags="%s"' % " ".join(extra), 'linkflags="%s"' % " ".join(extra)]
+
+        # cxxflags do not change the b2 target paths, only removing the objects forces the rebuild.
+        # Also before the instrumented build: objects of an earlier optimized build in this folder
+        # would be reused and the training run would profile nothing
+        objects = os.path.join(self.build_folder, "boost", "bin.v2")
+        self.output.info("PGO: instrumented build")
+        shutil.rmtree(objects, ignore_errors=True)
+        self.run_b2_phased(b2_exe, with_flags(generate))
+        self.output.info("PGO: training run")
+        self.run_pgo_training(generate, profile_dir)
+        if "clang" in str(self.settings.compiler):
+            self.run('llvm-profdata merge -output="%s" "%s"/*.profraw' % (profdata, profile_dir))
+        self.output.info("PGO: optimized build")
+        shutil.rmtree(objects, ignore_errors=True)
+        self.run_b2_phased(b2_exe, with_flags(use))
+
+    def run_pgo_training(self, profile_flags, profile_dir):
+        """Builds test_package/benchmark.cpp with the build flags against the instrumented stage
+        and runs it
+        """
+        cxx = self.compiler_executable()
+        cxxflags, linkflags = b2_compiler_flags(self.get_build_flags())
+        if not any(flag.startswith("-std=") for flag in cxxflags):
+            cxxflags.append("-std=c++11")
+        benchmarked = [libname for libname in ("serialization", "iostreams", "regex", "date_time",
+                                               "filesystem", "thread") if libname in self.enabled_libs]
+        cxxflags += ["-O2", "-DNDEBUG"] + ["-DBENCH_%s" % libname.upper() for libname in benchmarked]
+        # lib_list is in link order
+        libs = ["-lboost_%s" % libname for libname in lib_list if libname in lib_closure(benchmarked)]
+        lib_paths = [self.stage_lib_folder]
+        if "iostreams" in benchmarked:
+            for _, reference, module, _ in self.enabled_compression_backends:
+                cxxflags.append("-DBENCH_%s" % module.upper())
+            for name in ["zlib"] + [reference.split("/")[0] for _, reference, _, _ in self.enabled_compression_backends]:
+                lib_paths.append(self.deps_cpp_info[name].lib_paths[0])
+                libs.append("-l%s" % self.deps_cpp_info[name].libs[0])
+        if self.settings.os == "Linux":
+            libs.append("-lpthread")
+
+        training = os.path.join(self.build_folder, "pgo-training")
+        self.run('"%s" %s %s -I"%s" "%s" -o "%s" %s %s %s' % (
+            cxx, " ".join(cxxflags), " ".join(profile_flags), os.path.join(self.source_folder, self.folder_name),
+            os.path.join(self.source_folder, "test_package", "benchmark.cpp"), training,
+            " ".join('-L"%s"' % path for path in lib_paths), " ".join(libs), " ".join(linkflags + profile_flags)))
+        library_path = os.pathsep.join(lib_paths)
+        with tools.environment_append({"LD_LIBRARY_PATH": library_path, "DYLD_LIBRARY_PATH": library_path,
+                                       "LLVM_PROFILE_FILE": os.path.join(profile_dir, "%p.profraw")}):
+            self.run('"%s"' % training)
+
+    ##################### PRECOMPILED HEADER METHODS ###########################
+
+    @property
+    def pch_headers(self):
+        headers = [name.strip() for name in str(self.options.pch_headers).replace(",", " ").split()]
+        return headers or default_pch_headers
+
+    @traced("pch")
+    def build_pch(self):
+        """gcc only. Precompiles boost_pch.hpp, including every pch_headers entry, with the flags of the
+        libraries, the defines exported to consumers and CMake's flags of the build type, and
+        writes the CMake helper using it
+        """
+        folder = os.path.join(self.build_folder, "pch")
+        tools.mkdir(folder)
+        header = os.path.join(folder, "boost_pch.hpp")
+        tools.save(header, "#ifndef BOOST_PCH_HPP\n#define BOOST_PCH_HPP\n%s#endif\n"
+                   % "".join("#include <%s>\n" % name for name in self.pch_headers))
+
+        cxxflags, _ = b2_compiler_flags(self.get_build_flags())
+        cxxflags += cmake_build_type_flags.get(str(self.settings.build_type), [])
+        # gcc refuses a precompiled header built with other macros than the consumers see, and
+        # date_time, serialization, system test BOOST_ALL_DYN_LINK
+        cxxflags += ["-D%s" % define for define in self.consumer_defines if "-D%s" % define not in cxxflags]
+        cppstd = self.settings.get_safe("compiler.cppstd")
+        if cppstd and not any(flag.startswith("-std=") for flag in cxxflags):
+            cxxflags.append("-std=%s" % (("gnu++%s" % cppstd[3:]) if cppstd.startswith("gnu") else "c++%s" % cppstd))
+        output = header + ".gch"
+        start = time.time()
+        self.run('"%s" -x c++-header %s -I"%s" "%s" -o "%s"' % (
+            self.compiler_executable(), " ".join(cxxflags), os.path.join(self.build_folder, self.folder_name),
+            header, output))
+        self.output.info("Precompiled %s in %.1fs, %.1f MB" % (", ".join(self.pch_headers), time.time() - start,
+                                                               os.path.getsize(output) / 1e6))
+
+        # gcc picks boost_pch.hpp.gch next to the header, and warns when it cannot use it
+        use_flags = '-include "${BOOST_PCH_HEADER}" -Winvalid-pch'
+        tools.save(os.path.join(folder, "BoostPCH.cmake"), """\
+# Precompiled Boost headers of this package, built with:
+#   %(flags)s
+# Consumers need the same compiler and compatible flags.
+set(BOOST_PCH_HEADER "${CMAKE_CURRENT_LIST_DIR}/boost_pch.hpp")
+set(BOOST_PCH_HEADERS %(headers)s)
+
+function(boost_target_use_pch target)
+    separate_arguments(_boost_pch_flags UNIX_COMMAND "%(use_flags)s")
+    target_compile_options(${target} PRIVATE ${_boost_pch_flags})
+endfunction()
+""" % {"flags": " ".join(cxxflags), "headers": " ".join(self.pch_headers),
+       "use_flags": use_flags.replace('"', '\\"')})
+
+    ##################### TRACE METHODS ###########################
+
+    def write_trace(self, record):
+        """Tags a phase record with the configuration and appends it to CONAN_BOOST_TRACE_FILE,
+        a single append per line so concurrent builds can share the file
+        """
+        record.update({"recipe": "%s/%s" % (self.name, self.version), "pid": os.getpid()})
+        try:
+            record["settings"] = dict((name, str(value)) for name, value in self.settings.values_list)
+            record["options"] = dict((name, str(value)) for name, value in self.options.values.as_list())
+        except Exception:  # not every method sees settings and options
+            record.setdefault("settings", {})
+            record.setdefault("options", {})
+        package_folder = getattr(self, "package_folder", None)
+        record["package_id"] = os.path.basename(package_folder) if package_folder else None
+        try:
+            with open(os.environ["CONAN_BOOST_TRACE_FILE"], "a") as trace:
+                trace.write(json.dumps(record, sort_keys=True) + "\n")
+        except (IOError, OSError) as exc:
+            self.output.warn("Could not write the phase trace: %s" % exc)
+
+    ##################### BUILD PROFILE METHODS ###########################
+
+    def _profiled_library(self, record):
+        if record["kind"] == "link":
+            return library_of_binary(record["output"] or "")
+        parts = (record["source"] or "").replace("\\", "/").split("/")
+        for index, part in enumerate(parts[:-1]):
+            if part == "libs" and parts[index + 1] in lib_list:
+                return parts[index + 1]
+        return None
+
+    def write_build_profile(self):
+        """Summarizes the actions recorded by scripts/compile_profiler.py into build_profile.json
+        (slowest translation units, time per library) and build_profile.csv (every action)
+        """
+        if not os.path.isfile(self.build_profile_log):
+            return
+        records = [json.loads(line) for line in tools.load(self.build_profile_log).splitlines() if line.strip()]
+        if not records:
+            return
+        libraries = {}
+        for record in records:
+            record["seconds"] = record["end"] - record["start"]
+            record["library"] = self._profiled_library(record)
+            totals = libraries.setdefault(record["library"] or "other", {
+                "compile_seconds": 0.0, "link_seconds": 0.0, "translation_units": 0, "peak_rss_kib": 0})
+            totals["%s_seconds" % record["kind"]] += record["seconds"]
+            totals["peak_rss_kib"] = max(totals["peak_rss_kib"], record["peak_rss_kib"] or 0)
+            if record["kind"] == "compile":
+                totals["translation_units"] += 1
+        compiles = sorted((r for r in records if r["kind"] == "compile"), key=lambda r: r["seconds"], reverse=True)
+        report = {
+            "configuration": dict((str(name), str(value)) for name, value in self.settings.values_list),
+            "enabled_libs": self.enabled_libs,
+            "wall_seconds": max(r["end"] for r in records) - min(r["start"] for r in records),
+            "libraries": libraries,
+            "slowest_translation_units": [{key: r[key] for key in ("source", "library", "seconds", "peak_rss_kib")}
+                                          for r in compiles[:50]],
+        }
+        report["configuration"]["shared"] = str(self.options.shared)
+        tools.save(os.path.join(self.build_folder, "build_profile.json"), json.dumps(report, indent=2))
+        with open(os.path.join(self.build_folder, "build_profile.csv"), "w") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["kind", "library", "source", "output", "seconds", "peak_rss_kib", "returncode"])
+            for r in records:
+                writer.writerow([r["kind"], r["library"], r["source"], r["output"], "%.3f" % r["seconds"],
+                                 r["peak_rss_kib"], r["returncode"]])
+
+        self.output.info("Slowest translation units:")
+        for r in compiles[:10]:
+            self.output.info("  %7.1fs %7d KiB  %s" % (r["seconds"], r["peak_rss_kib"] or 0, r["source"]))
+        self.output.info("Time per library (compile + link):")
+        for libname, totals in sorted(libraries.items(), key=lambda item: -item[1]["compile_seconds"]):
+            self.output.info("  %7.1fs  %s" % (totals["compile_seconds"] + totals["link_seconds"], libname))
+
+        collect_dir = os.environ.get("CONAN_BOOST_PROFILE_DIR")
+        if collect_dir:
+            # The build folder is named after the package id in the conan cache
+            tools.mkdir(collect_dir)
+            for extension in ("json", "csv"):
+                shutil.copy2(os.path.join(self.build_folder, "build_profile.%s" % extension),
+                             os.path.join(collect_dir, "%s.%s" % (os.path.basename(self.build_folder), extension)))
+
+    ##################### STAGE REUSE METHODS ###########################
+
+    @property
+    def enabled_libs(self):
+        return [libname for libname in lib_list if not getattr(self.options, "without_%s" % libname)]
+
+    @property
+    def stage_lib_folder(self):
+        return os.path.join(self.build_folder, self.folder_name, "stage", "lib")
 
-    def get_build_flags(self):
+    def stage_cache_folder(self, flags, build_type=None):
+        """Configurations only differing in without_* options stage identical binaries for the
+        libraries they have in common, so the key ignores them. The recipe digest keeps stages of
+        former recipe revisions or patches from being served
+        """
+        key = ["%s=%s" % (name, build_type if name == "build_type" and build_type else value)
+               for name, value in self.settings.values_list]
+        key.append("recipe=%s" % recipe_digest())
+        if os.path.isfile(self.patch_stamp):
+            key.append("patches=%s" % " ".join(tools.load(self.patch_stamp).split()))
+        key.extend(flag for flag in flags if not flag.startswith("--without-"))
+        user_config = tools.load(os.path.join(self.build_folder, "user-config.jam"))
+        # The launchers (build profiler, compiler cache) do not change the binaries, and the
+        # profiler's path is specific to the build folder
+        for launcher in self.compiler_launchers():
+            user_config = user_config.replace(' "%s"' % launcher.replace("\\", "/"), "")
+        key.extend(line for line in user_config.splitlines()
+                   if not line.startswith(("using zlib", "using bzip2", "using lzma", "using zstd")))
+        if self.unity_libs:
+            key.append("unity=%s" % ",".join(self.unity_libs))
+        digest = hashlib.sha256("\n".join(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.boost_cache_folder, "stage", self.version, digest)
+
+    def restore_stage(self, stage_cache):
+        """Copies the binaries of the enabled libraries, and of the ones they link, from a stage
+        published by a configuration with the same key. Returns the enabled libraries it lacks
+        """
+        listing = os.path.join(stage_cache, "libraries.txt")
+        if not os.path.isfile(listing):
+            return self.enabled_libs
+        available = set(tools.load(listing).split())
+        reused = lib_closure(self.enabled_libs) & available
+        tools.mkdir(self.stage_lib_folder)
+        for filename in os.listdir(stage_cache):
+            if library_of_binary(filename) in reused:
+                target = os.path.join(self.stage_lib_folder, filename)
+                if os.path.lexists(target):
+                    os.unlink(target)
+                copy_file_or_link(os.path.join(stage_cache, filename), target)
+        return [libname for libname in self.enabled_libs if libname not in available]
+
+    def publish_stage(self, stage_cache, stage_lib_folder=None):
+        """Merges the staged binaries into the shared stage, files are moved in place atomically
+        and the library listing is written last, so concurrent readers never see partial files
+        """
+        stage_lib_folder = stage_lib_folder or self.stage_lib_folder
+        tools.mkdir(stage_cache)
+        listing = os.path.join(stage_cache, "libraries.txt")
+        available = set(tools.load(listing).split()) if os.path.isfile(listing) else set()
+        available.update(self.enabled_libs)
+        for filename in os.listdir(stage_lib_folder):
+            available.add(library_of_binary(filename))
+            target = os.path.join(stage_cache, filename)
+            if os.path.lexists(target):
+                continue
+            partial = "%s.%s.part" % (target, os.getpid())
+            copy_file_or_link(os.path.join(stage_lib_folder, filename), partial)
+            os.replace(partial, target)
+        available.discard(None)
+        partial = "%s.%s.part" % (listing, os.getpid())
+        tools.save(partial, "\n".join(sorted(available)))
+        os.replace(partial, listing)
+
+    @property
+    def b2_jobs(self):
+        """CONAN_BOOST_B2_JOBS caps the b2 parallelism, build.py splits its job budget this way"""
+        return int(os.environ.get("CONAN_BOOST_B2_JOBS", "0")) or tools.cpu_count()
+
+    def get_build_flags(self, build_type=None, shared=None):
+        """b2 flags of this configuration, or of a sibling with another build_type and/or shared"""
+        build_type = build_type or str(self.settings.build_type)
+        shared = self.options.shared if shared is None else shared
 
         if tools.cross_building(self.settings):
             flags = self.get_build_cross_flags()
@@ -182,8 +1359,8 @@ class BoostConan(ConanFile):
         if self.settings.os == "Windows" and self.settings.compiler == "gcc":
             flags.append("threading=multi")
 
-        flags.append("link=%s" % ("static" if not self.options.shared else "shared"))
-        if self.settings.build_type == "Debug":
+        flags.append("link=%s" % ("static" if not shared else "shared"))
+        if build_type == "Debug":
             flags.append("variant=debug")
         else:
             flags.append("variant=release")
@@ -192,6 +1369,13 @@ class BoostConan(ConanFile):
             if getattr(self.options, "without_%s" % libname):
                 flags.append("--without-%s" % libname)
 
+        flags.extend("define=%s" % define for define in tuning_defines[str(self.options.tuning)])
+
+        if self.zip_bzip2_requires_needed:
+            # iostreams would otherwise pick up whatever the build machine has installed
+            flags.extend("-s%s=1" % no_flag for option, _, _, no_flag in compression_backends
+                         if not self.options.get_safe(option))
+
         # CXX FLAGS
         cxx_flags = []
         # fPIC DEFINITION
@@ -235,6 +1419,24 @@ class BoostConan(ConanFile):
 
             flags.append("macosx-version=%s" % self.b2_macosx_version())
 
+        if shared and self.options.get_safe("slim_shared"):
+            # Only the BOOST_SYMBOL_EXPORT API stays visible, unused sections are dropped at link time
+            flags.append("visibility=hidden")
+            cxx_flags.extend(["-fvisibility-inlines-hidden", "-ffunction-sections", "-fdata-sections"])
+            if tools.is_apple_os(self.settings.os):
+                flags.append('linkflags="-Wl,-dead_strip"')
+            elif self.settings.os != "Windows":
+                flags.append('linkflags="-Wl,--gc-sections -Wl,-O1 -Wl,--as-needed"')
+
+        lto = self.options.get_safe("lto")
+        if lto and lto != "none":
+            lto_flag = "-flto=thin" if lto == "thin" else "-flto"
+            cxx_flags.append(lto_flag)
+            if self.settings.compiler == "gcc":
+                # Fat objects keep static libraries usable by consumers not linking with LTO
+                cxx_flags.append("-ffat-lto-objects")
+            flags.append('linkflags="%s"' % lto_flag)
+
         cxx_flags = 'cxxflags="%s"' % " ".join(cxx_flags) if cxx_flags else ""
         flags.append(cxx_flags)
 
@@ -291,10 +1493,13 @@ class BoostConan(ConanFile):
                 self.deps_cpp_info["zlib"].lib_paths[0].replace('\\', '/'),
                 self.deps_cpp_info["zlib"].libs[0])
 
-            # contents += "\nusing bzip2 : 1.0.6 : <include>%s <search>%s <name>%s ;" % (
-            #     self.deps_cpp_info["bzip2"].include_paths[0].replace('\\', '/'),
-            #     self.deps_cpp_info["bzip2"].lib_paths[0].replace('\\', '/'),
-            #     self.deps_cpp_info["bzip2"].libs[0])
+            for _, reference, module, _ in self.enabled_compression_backends:
+                name, version = reference.split("@")[0].split("/")
+                contents += "\nusing %s : %s : <include>%s <search>%s <name>%s ;" % (
+                    module, version,
+                    self.deps_cpp_info[name].include_paths[0].replace('\\', '/'),
+                    self.deps_cpp_info[name].lib_paths[0].replace('\\', '/'),
+                    self.deps_cpp_info[name].libs[0])
 
         if not self.options.without_python:
             contents += "\nusing python : {} : {} ;".format(sys.version[:3], sys.executable.replace('\\', '/'))
@@ -303,6 +1508,11 @@ class BoostConan(ConanFile):
         exe = compiler_command or exe  # Prioritize CXX
         # Specify here the toolset with the binary if present if don't empty parameter : :
         contents += '\nusing "%s" : "%s" : ' % (toolset, version)
+        launchers = self.compiler_launchers()
+        if launchers:
+            # b2 accepts the command as a list, the launchers need the explicit compiler behind them
+            contents += "".join(' "%s"' % launcher.replace("\\", "/") for launcher in launchers)
+            exe = exe or self._default_compiler_executable(toolset, version)
         contents += ' "%s"' % exe.replace("\\", "/")
 
         contents += " : \n"
@@ -326,7 +1536,104 @@ class BoostConan(ConanFile):
 
         self.output.warn(contents)
         filename = "%s/user-config.jam" % folder
-        tools.save(filename,  contents)
+        # Rewriting an unchanged file would only touch its timestamp
+        if os.path.isfile(filename) and tools.load(filename) == contents:
+            self.output.info("user-config.jam is up to date")
+        else:
+            tools.save(filename,  contents)
+
+    ##################### COMPILER LAUNCHER METHODS ###########################
+
+    @property
+    def compiler_launcher(self):
+        """ccache or sccache wrapping the compiler in user-config.jam, None to call it directly"""
+        launcher = self.options.get_safe("compiler_launcher")
+        if launcher is None:
+            return None
+        launcher = str(launcher)
+        if launcher == "none":
+            launcher = os.environ.get("CONAN_BOOST_COMPILER_LAUNCHER", "none")
+        if launcher == "none":
+            return None
+        if not tools.which(launcher):
+            self.output.warn("Compiler launcher %s not found, compiling without it" % launcher)
+            return None
+        return launcher
+
+    @property
+    def build_profiling(self):
+        """CONAN_BOOST_PROFILE_BUILD=1 records every compile and link action of the b2 runs"""
+        return env_flag("CONAN_BOOST_PROFILE_BUILD") and self.settings.compiler != "Visual Studio"
+
+    @property
+    def build_profile_log(self):
+        return os.path.join(self.build_folder, "build_profile.jsonl")
+
+    def compiler_launchers(self):
+        """Commands put in front of the compiler, outermost first"""
+        launchers = []
+        if self.build_profiling:
+            launchers.extend([sys.executable, os.path.join(self.source_folder, "scripts", "compile_profiler.py")])
+        if self.compiler_launcher:
+            launchers.append(self.compiler_launcher)
+        return launchers
+
+    def compiler_executable(self):
+        """The compiler b2 runs, for the direct compiler calls of the recipe"""
+        toolset, version, exe = self.get_toolset_version_and_exe()
+        return os.environ.get("CXX") or exe or self._default_compiler_executable(toolset, version)
+
+    def _default_compiler_executable(self, toolset, version):
+        """The executable b2 would pick by itself for an empty command"""
+        candidates = {"gcc": ["g++-%s" % version, "g++"],
+                      "clang": ["clang++-%s" % version, "clang++"]}.get(toolset, [])
+        for candidate in candidates:
+            if tools.which(candidate):
+                return candidate
+        raise Exception("Cannot use a compiler launcher with toolset %s, set CXX" % toolset)
+
+    def compiler_launcher_env(self):
+        env = {}
+        if self.build_profiling:
+            env["CONAN_BOOST_PROFILE_LOG"] = self.build_profile_log
+        if self.compiler_launcher == "ccache":
+            # Every configuration builds in its own folder: hash paths relative to it, so identical
+            # translation units hit across configurations. The command line, and so every cxxflags
+            # and define= variation, is still part of the key.
+            env.update({"CCACHE_BASEDIR": self.build_folder,
+                        "CCACHE_NOHASHDIR": "1"})
+        return env
+
+    def compiler_launcher_stats(self):
+        """Snapshot of the ccache counters, empty if not available"""
+        if self.compiler_launcher != "ccache":
+            return {}
+        output = StringIO()
+        try:
+            self.run("ccache --print-stats", output=output)
+        except Exception:
+            return {}  # ccache < 4
+        stats = {}
+        for line in output.getvalue().splitlines():
+            key, _, value = line.partition("\t")
+            if value.strip().isdigit():
+                stats[key] = int(value)
+        return stats
+
+    def report_compiler_launcher_stats(self, before):
+        launcher = self.compiler_launcher
+        if not launcher:
+            return
+        after = self.compiler_launcher_stats()
+        if before and after:
+            delta = lambda key: after.get(key, 0) - before.get(key, 0)
+            hits = delta("direct_cache_hit") + delta("preprocessed_cache_hit")
+            misses = delta("cache_miss")
+            total = hits + misses
+            self.output.info("ccache: %d hits, %d misses (%.0f%% hit rate)" % (
+                hits, misses, 100.0 * hits / total if total else 0))
+        else:
+            self.run("%s %s" % (launcher, "--show-stats" if launcher == "sccache" else "-s"))
 
     def get_toolset_version_and_exe(self):
         compiler_version = str(self.settings.compiler.version)
@@ -369,8 +1676,16 @@ class BoostConan(ConanFile):
                                                      str(self.settings.compiler))
         return with_toolset
 
+    @traced("bootstrap")
     def bootstrap(self):
         folder = os.path.join(self.source_folder, self.folder_name, "tools", "build")
+        b2_exe = os.path.join(folder, "b2.exe") if tools.os_info.is_windows else os.path.join(folder, "b2")
+        if self._b2_usable(b2_exe):
+            # Bootstrapped by an earlier build() in this folder
+            self.output.info("Reusing b2 engine %s" % b2_exe)
+            return b2_exe
+        if self._restore_cached_b2(b2_exe):
+            return b2_exe
         try:
             bootstrap = "bootstrap.bat" if tools.os_info.is_windows else "./bootstrap.sh"
             with tools.vcvars(self.settings) if self.settings.compiler == "Visual Studio" else tools.no_op():
@@ -384,49 +1699,276 @@ class BoostConan(ConanFile):
             if os.path.exists(os.path.join(folder, "bootstrap.log")):
                 self.output.warn(tools.load(os.path.join(folder, "bootstrap.log")))
             raise
-        return os.path.join(folder, "b2.exe") if tools.os_info.is_windows else os.path.join(folder, "b2")
+        self._store_cached_b2(b2_exe)
+        return b2_exe
+
+    @property
+    def cached_b2_folder(self):
+        """The b2 engine only depends on the host and the bootstrap toolset, not on the target settings"""
+        host = "%s-%s-%s" % (platform.system(), platform.machine(), self._get_boostrap_toolset())
+        return os.path.join(self.boost_cache_folder, "b2", self.version, host)
+
+    def _b2_usable(self, b2_exe):
+        if not os.path.isfile(b2_exe):
+            return False
+        try:
+            self.run('"%s" -v' % b2_exe, output=StringIO())
+        except Exception:
+            return False
+        return True
+
+    def _restore_cached_b2(self, b2_exe):
+        cached = os.path.join(self.cached_b2_folder, os.path.basename(b2_exe))
+        stamp = cached + ".sha256"
+        if not os.path.isfile(cached) or not os.path.isfile(stamp):
+            return False
+        try:
+            tools.check_sha256(cached, tools.load(stamp).strip())
+            shutil.copy2(cached, b2_exe)
+        except Exception as exc:
+            self.output.warn("Cached b2 engine is unusable, bootstrapping again: %s" % exc)
+            return False
+        if not self._b2_usable(b2_exe):
+            self.output.warn("Cached b2 engine does not run, bootstrapping again")
+            return False
+        self.output.info("Using cached b2 engine %s" % cached)
+        return True
+
+    def _store_cached_b2(self, b2_exe):
+        folder = self.cached_b2_folder
+        cached = os.path.join(folder, os.path.basename(b2_exe))
+        tools.mkdir(folder)
+        partial = "%s.%s.part" % (cached, os.getpid())
+        try:
+            shutil.copy2(b2_exe, partial)
+            os.replace(partial, cached)
+            tools.save(cached + ".sha256", tools.sha256sum(cached))
+        except (IOError, OSError) as exc:
+            # The cache is an optimization only, the freshly bootstrapped engine is good to go
+            self.output.warn("Could not cache the b2 engine: %s" % exc)
 
     ####################################################################
 
+    @traced("package")
     def package(self):
         # This stage/lib is in source_folder... Face palm, looks like it builds in build but then
         # copy to source with the good lib name
         out_lib_dir = os.path.join(self.folder_name, "stage", "lib")
-        self.copy(pattern="*", dst="include/boost", src="%s/boost" % self.folder_name)
-        if not self.options.shared:
-            self.copy(pattern="*.a", dst="lib", src=out_lib_dir, keep_path=False)
-        self.copy(pattern="*.so", dst="lib", src=out_lib_dir, keep_path=False, symlinks=True)
-        self.copy(pattern="*.so.*", dst="lib", src=out_lib_dir, keep_path=False, symlinks=True)
-        self.copy(pattern="*.dylib*", dst="lib", src=out_lib_dir, keep_path=False)
-        self.copy(pattern="*.lib", dst="lib", src=out_lib_dir, keep_path=False)
-        self.copy(pattern="*.dll", dst="bin", src=out_lib_dir, keep_path=False)
-
-        # When first call with source do not package anything
-        if not os.path.exists(os.path.join(self.package_folder, "lib")):
-            return
+        if self.options.get_safe("shared_headers"):
+            headers = []
+        elif self.options.minimal_headers:
+            headers = self.minimal_headers()
+        else:
+            headers = []
+            for root, _, filenames in os.walk(os.path.join(self.folder_name, "boost")):
+                headers.extend(os.path.relpath(os.path.join(root, name), self.folder_name) for name in filenames)
+        entries = [(os.path.join(self.folder_name, relpath), os.path.join("include", relpath)) for relpath in headers]
+        if os.path.isdir(out_lib_dir):
+            entries.extend(self.stage_package_entries(out_lib_dir))
+        if self.options.get_safe("pch"):
+            entries.extend((os.path.join("pch", name), os.path.join("pch", name)) for name in os.listdir("pch"))
+
+        start = time.time()
+        methods = {}
+        strategies = package_strategies(self.package_hardlinks)
+        manifest = {"headers": 0, "headers_bytes": 0, "files": []}
+        for src, dst in entries:
+            method = package_file(src, os.path.join(self.package_folder, dst), strategies)
+            methods[method] = methods.get(method, 0) + 1
+            if dst.startswith("include"):
+                manifest["headers"] += 1
+                manifest["headers_bytes"] += os.lstat(src).st_size
+            else:
+                manifest["files"].append({"path": dst.replace(os.sep, "/"), "method": method})
+        if self.options.get_safe("split_debug"):
+            debug_files = self.split_debug_info([entry["path"] for entry in manifest["files"]])
+            for entry in manifest["files"]:
+                if entry["path"] in debug_files:
+                    entry["debug"] = debug_files[entry["path"]]
+        for entry in manifest["files"]:
+            entry["bytes"] = os.lstat(os.path.join(self.package_folder, entry["path"])).st_size
+        manifest.update(self.library_manifest())
+        tools.save(os.path.join(self.package_folder, "boost_manifest.json"), json.dumps(manifest, indent=2))
+        self.output.info("Packaged %d files in %.1fs (%s)" % (len(entries), time.time() - start,
+                         ", ".join("%d %s" % (count, method) for method, count in sorted(methods.items()))))
+
+    def require_debug_store(self):
+        """CONAN_BOOST_DEBUG_STORE, required by split_debug: conan neither packages nor uploads the
+        build folder, the debug info would be lost without it
+        """
+        store = os.environ.get("CONAN_BOOST_DEBUG_STORE")
+        if not store:
+            raise Exception("split_debug needs CONAN_BOOST_DEBUG_STORE, the folder keeping the debug info")
+        return store
+
+    @traced("split_debug")
+    def split_debug_info(self, paths):
+        """Moves the debug info of the packaged libraries to the CONAN_BOOST_DEBUG_STORE tree, through
+        <build folder>/debug-info. Shared libraries keep a gnu-debuglink to their .debug file, static
+        libraries are stored unstripped. Returns the .debug file name per path.
+        """
+        store = self.require_debug_store()
+        objcopy = os.environ.get("OBJCOPY", "objcopy")
+        debug_folder = os.path.join(self.build_folder, "debug-info")
+        tools.mkdir(debug_folder)
+        debug_files = {}
+        before, after = 0, 0
+        for path in paths:
+            packaged = os.path.join(self.package_folder, path)
+            name = os.path.basename(path)
+            if os.path.islink(packaged) or not (name.endswith(".a") or ".so" in name):
+                continue
+            debug_file = os.path.join(debug_folder, name + ".debug")
+            stripped = packaged + ".stripped"
+            if name.endswith(".a"):
+                # Consumers link the objects themselves, the unstripped archive is the debug data
+                shutil.copy2(packaged, debug_file)
+                self.run('"%s" --strip-debug "%s" "%s"' % (objcopy, packaged, stripped))
+            else:
+                self.run('"%s" --only-keep-debug --compress-debug-sections "%s" "%s"' % (objcopy, packaged, debug_file))
+                self.run('"%s" --strip-debug --add-gnu-debuglink="%s" "%s" "%s"' % (objcopy, debug_file, packaged, stripped))
+            before += os.path.getsize(packaged)
+            # A new file, the stage binaries hardlinked into the package stay intact
+            os.replace(stripped, packaged)
+            after += os.path.getsize(packaged)
+            debug_files[path] = os.path.basename(debug_file)
+            self.publish_debug_info(packaged, debug_file, store)
+        self.output.info("Split debug info of %d libraries, %.1f MB => %.1f MB, debug files in %s"
+                         % (len(debug_files), before / 1e6, after / 1e6, store))
+        return debug_files
+
+    def publish_debug_info(self, packaged, debug_file, store):
+        """Stores debug_file as <store>/.build-id/xx/yyyy.debug, gdb's debug-file-directory layout,
+        or under the package id for binaries without a build id
+        """
+        output = StringIO()
+        self.run('"%s" -n "%s"' % (os.environ.get("READELF", "readelf"), packaged), output=output)
+        build_ids = re.findall(r"Build ID: ([0-9a-f]+)", output.getvalue())
+        if build_ids:
+            target = os.path.join(store, ".build-id", build_ids[0][:2], build_ids[0][2:] + ".debug")
+        else:
+            target = os.path.join(store, "%s-%s" % (self.name, self.version), os.path.basename(self.package_folder),
+                                  os.path.basename(debug_file))
+        tools.mkdir(os.path.dirname(target))
+        partial = "%s.%s.part" % (target, os.getpid())
+        shutil.copy2(debug_file, partial)
+        os.replace(partial, target)
 
-        self.renames_to_make_cmake_find_package_happy()
+    @property
+    def package_hardlinks(self):
+        """Hardlinks of the build files into the package with CONAN_BOOST_PACKAGE_HARDLINKS=1, only safe
+        when the build folder is not built again (conan create)
+        """
+        return env_flag("CONAN_BOOST_PACKAGE_HARDLINKS")
+
+    def stage_package_entries(self, out_lib_dir):
+        """(source, package relative destination) of the staged binaries, in one pass over stage/lib"""
+        patterns = [("*.so", "lib"), ("*.so.*", "lib"), ("*.dylib*", "lib"), ("*.lib", "lib"), ("*.dll", "bin")]
+        if not self.options.shared:
+            patterns.insert(0, ("*.a", "lib"))
+        entries, packaged = [], set()
+        for filename in sorted(os.listdir(out_lib_dir)):
+            for pattern, folder in patterns:
+                if fnmatch.fnmatch(filename, pattern):
+                    dst = os.path.join(folder, self.renamed_lib(filename) if folder == "lib" else filename)
+                    if dst in packaged:  # the former renames kept the first file
+                        dst = os.path.join(folder, filename)
+                    elif dst != os.path.join(folder, filename):
+                        self.output.info("Rename: %s => %s" % (filename, dst))
+                    packaged.add(dst)
+                    entries.append((os.path.join(out_lib_dir, filename), dst))
+                    break
+        return entries
 
-    def renames_to_make_cmake_find_package_happy(self):
-        if not self.options.skip_lib_rename:
+    def renamed_lib(self, libname):
+        if not self.options.skip_lib_rename and "-" in libname:
             # CMake findPackage help
-            renames = []
-            for libname in os.listdir(os.path.join(self.package_folder, "lib")):
-                new_name = libname
-                libpath = os.path.join(self.package_folder, "lib", libname)
-                if "-" in libname:
-                    new_name = libname.split("-", 1)[0] + "." + libname.split(".")[-1]
-                    if new_name.startswith("lib"):
-                        new_name = new_name[3:]
-                renames.append([libpath, os.path.join(self.package_folder, "lib", new_name)])
-
-            for original, new in renames:
-                if original != new and not os.path.exists(new):
-                    self.output.info("Rename: %s => %s" % (original, new))
-                    os.rename(original, new)
+            new_name = libname.split("-", 1)[0] + "." + libname.split(".")[-1]
+            if new_name.startswith("lib"):
+                new_name = new_name[3:]
+            return new_name
+        return libname
 
+    @property
+    def header_only_libs(self):
+        return [name.strip() for name in str(self.options.header_only_libs).replace(",", " ").split()]
+
+    @traced("minimal_headers")
+    def minimal_headers(self):
+        """The include closure of the enabled libraries and of header_only_libs, relative to the
+        source tree, instead of the whole boost/ tree. Reports the saving.
+        """
+        include_root = os.path.join(self.build_folder, self.folder_name)
+        libnames = [] if self.options.header_only else self.enabled_libs
+        start = time.time()
+        headers = header_closure(include_root, header_seeds(libnames + self.header_only_libs))
+        elapsed = time.time() - start
+
+        full_count, full_size = 0, 0
+        for root, _, filenames in os.walk(os.path.join(include_root, "boost")):
+            full_count += len(filenames)
+            full_size += sum(os.path.getsize(os.path.join(root, name)) for name in filenames)
+        size = sum(os.path.getsize(os.path.join(include_root, relpath)) for relpath in headers)
+        report = {"libraries": libnames, "header_only_libs": self.header_only_libs,
+                  "headers": len(headers), "headers_full": full_count,
+                  "bytes": size, "bytes_full": full_size, "closure_seconds": round(elapsed, 2)}
+        tools.save(os.path.join(self.build_folder, "header_report.json"), json.dumps(report, indent=2))
+        self.output.info("Minimal headers: %d of %d headers, %.1f of %.1f MB (%.0f%% smaller), found in %.1fs"
+                         % (len(headers), full_count, size / 1e6, full_size / 1e6,
+                            100.0 * (full_size - size) / max(full_size, 1), elapsed))
+        return sorted(headers)
+
+    @traced("package_info")
     def package_info(self):
-        gen_libs = tools.collect_libs(self)
+        manifest_file = os.path.join(self.package_folder, "boost_manifest.json")
+        manifest = json.loads(tools.load(manifest_file)) if os.path.exists(manifest_file) else {}
+        if "components" not in manifest:  # packages created before the manifest
+            manifest = self.library_manifest()
+
+        # headers: include dirs and defines, _libboost: what every compiled library needs,
+        # then one component per library, e.g. Boost::regex
+        # The tuning is part of the package id, except for the single header-only package
+        self.cpp_info.components["headers"].defines = manifest["defines"] + tuning_defines[str(self.options.tuning)]
+        self.cpp_info.components["headers"].libs = []
+        if self.options.get_safe("pch"):
+            self.cpp_info.components["headers"].build_modules = ["pch/BoostPCH.cmake"]
+        if self.options.get_safe("shared_headers"):
+            self.cpp_info.components["headers"].includedirs = []
+            self.cpp_info.components["headers"].requires = ["Boost-headers::Boost-headers"]
+        if not self.options.header_only:
+            self.cpp_info.components["_libboost"].requires = ["headers"]
+            self.cpp_info.components["_libboost"].system_libs = manifest["system_libs"]
+            for libname, component in manifest["components"].items():
+                self.cpp_info.components[libname].libs = component["libs"]
+                self.cpp_info.components[libname].requires = ["_libboost"] + component["requires"]
+        self.output.info("LIBRARIES: %s" % manifest["libs"])
+        self.output.info("Package folder: %s" % self.package_folder)
+
+        self.env_info.BOOST_ROOT = self.package_folder
+
+    @property
+    def consumer_defines(self):
+        """Defines of the package's consumers, besides the tuning ones"""
+        defines = []
+        if not self.options.header_only and self.options.shared:
+            defines.append("BOOST_ALL_DYN_LINK")
+        else:
+            defines.append("BOOST_USE_STATIC_LIBS")
+
+        if not self.options.header_only:
+            if not self.options.without_python:
+                if not self.options.shared:
+                    defines.append("BOOST_PYTHON_STATIC_LIB")
+            if self.settings.compiler == "Visual Studio" and self.options.magic_autolink == False:
+                # DISABLES AUTO LINKING! NO SMART AND MAGIC DECISIONS THANKS!
+                defines.append("BOOST_ALL_NO_LIB")
+        return defines
+
+    def library_manifest(self):
+        """Link ordered libraries, defines and system libraries of the package, computed once by
+        package() instead of by every consumer
+        """
+        gen_libs = tools.collect_libs(self, folder="lib")  # cpp_info does not exist yet in package()
 
         # List of lists, so if more than one matches the lib like serialization and wserialization
         # both will be added to the list
@@ -434,7 +1976,7 @@ class BoostConan(ConanFile):
 
         # The order is important, reorder following the lib_list order
         missing_order_info = []
-        for real_lib_name in gen_libs:
+        for real_lib_name in sorted(gen_libs):
             for pos, alib in enumerate(lib_list):
                 if os.path.splitext(real_lib_name)[0].split("-")[0].endswith(alib):
                     ordered_libs[pos].append(real_lib_name)
@@ -445,40 +1987,40 @@ class BoostConan(ConanFile):
                     missing_order_info.append(real_lib_name)  # Assume they do not depend on other
 
         # Flat the list and append the missing order
-        self.cpp_info.libs = [item for sublist in ordered_libs
-                                      for item in sublist if sublist] + missing_order_info
+        libs = [item for sublist in ordered_libs for item in sublist if sublist] + missing_order_info
 
         if self.options.without_test:  # remove boost_unit_test_framework
-            self.cpp_info.libs = [lib for lib in self.cpp_info.libs if "unit_test" not in lib]
-
-        self.output.info("LIBRARIES: %s" % self.cpp_info.libs)
-        self.output.info("Package folder: %s" % self.package_folder)
-
-        if not self.options.header_only and self.options.shared:
-            self.cpp_info.defines.append("BOOST_ALL_DYN_LINK")
-        else:
-            self.cpp_info.defines.append("BOOST_USE_STATIC_LIBS")
+            libs = [lib for lib in libs if "unit_test" not in lib]
 
+        defines = self.consumer_defines
+        system_libs = []
         if not self.options.header_only:
-            if not self.options.without_python:
-                if not self.options.shared:
-                    self.cpp_info.defines.append("BOOST_PYTHON_STATIC_LIB")
-
             if self.settings.compiler == "Visual Studio":
                 if self.options.magic_autolink == False:
-                    # DISABLES AUTO LINKING! NO SMART AND MAGIC DECISIONS THANKS!
-                    self.cpp_info.defines.extend(["BOOST_ALL_NO_LIB"])
                     self.output.info("Disabled magic autolinking (smart and magic decisions)")
                 else:
                     self.output.info("Enabled magic autolinking (smart and magic decisions)")
 
                 # https://github.com/conan-community/conan-boost/issues/127#issuecomment-404750974
-                self.cpp_info.libs.append("bcrypt")
+                system_libs.append("bcrypt")
             elif self.settings.os == "Linux":
                 # https://github.com/conan-community/conan-boost/issues/135
-                self.cpp_info.libs.append("pthread")
-
-        self.env_info.BOOST_ROOT = self.package_folder
+                system_libs.append("pthread")
+
+        # One component per library with binaries, depending on the components it links
+        components = {}
+        for lib in libs:
+            libname = library_of_binary(lib) or lib
+            components.setdefault(libname, {"libs": [], "requires": []})["libs"].append(lib)
+        for libname, component in components.items():
+            component["requires"] = [dependency for dependency in lib_dependencies.get(libname, [])
+                                     if dependency in components]
+            if libname == "iostreams" and self.zip_bzip2_requires_needed:
+                component["requires"].append("zlib::zlib")
+                component["requires"].extend("%s::%s" % (reference.split("/")[0], reference.split("/")[0])
+                                             for _, reference, _, _ in self.enabled_compression_backends)
+
+        return {"libs": libs, "defines": defines, "system_libs": system_libs, "components": components}
 
     def b2_macosx_version(self):
         sdk_name = tools.apple_sdk_name(self.settings)
@@ -0,0 +1,51 @@
+from conans import ConanFile, python_requires
+from conans import tools
+import os
+
+# The main recipe has to be exported first, its source handling (archive cache, mirrors, sha256
+# verification) is reused as is
+base = python_requires("Boost/1.75.0@%s/%s" % (os.getenv("CONAN_USERNAME", "camposs"),
+                                             os.getenv("CONAN_CHANNEL", "stable")))
+
+
+class BoostHeadersConan(ConanFile):
+    """The boost/ include tree, shared by all binary packages built with shared_headers=True"""
+    name = "Boost-headers"
+    version = base.BoostConan.version
+    folder_name = base.BoostConan.folder_name
+    archive_name = base.BoostConan.archive_name
+    url = base.BoostConan.url
+    license = base.BoostConan.license
+    no_copy_source = True
+
+    boost_cache_folder = base.BoostConan.boost_cache_folder
+    cached_archive = base.BoostConan.cached_archive
+    source_mirrors = base.BoostConan.source_mirrors
+    fetch_source = base.BoostConan.fetch_source
+    _open_mirror = base.BoostConan._open_mirror
+    _download_archive = base.BoostConan._download_archive
+    _verify_archive = base.BoostConan._verify_archive
+    _extract_archive = base.BoostConan._extract_archive
+    write_trace = base.BoostConan.write_trace
+
+    def source(self):
+        self.fetch_source(self.source_folder, lambda name: name.startswith("%s/boost/" % self.folder_name))
+        # The header patches of the main recipe. Every platform gets them since the package is
+        # shared, the cuda one only changes the preprocessor config seen by nvcc with MSVC
+        patches = os.path.join(os.path.dirname(base.__file__), "patches")
+        tools.patch(base_path=os.path.join(self.source_folder, self.folder_name),
+                    patch_file=os.path.join(patches, "fix_pcl_1.11_compiler_error_cuda.patch"), strip=2)
+        tools.replace_in_file(os.path.join(self.source_folder, self.folder_name, "boost", "math", "quaternion.hpp"),
+            """        private:
+           T a, b, c, d;""",
+            """        protected:
+           T a, b, c, d;""")
+
+    def package(self):
+        self.copy(pattern="*", dst="include/boost", src="%s/boost" % self.folder_name)
+
+    def package_id(self):
+        self.info.header_only()
+
+    def package_info(self):
+        self.env_info.BOOST_ROOT = self.package_folder
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compiler launcher recording every compile and link action b2 runs through it.
+#
+#   compile_profiler.py <compiler or launcher> <arguments...>
+#
+# One JSON line per action is appended to $CONAN_BOOST_PROFILE_LOG: kind, source, output,
+# start and end timestamps, peak RSS of the compiler in KiB and its exit code.
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+source_extensions = (".c", ".cc", ".cpp", ".cxx", ".S", ".asm")
+
+
+def describe(args):
+    output = args[args.index("-o") + 1] if "-o" in args[:-1] else None
+    if "-c" in args:
+        sources = [arg for arg in args if arg.endswith(source_extensions)]
+        return "compile", sources[-1] if sources else None, output
+    if output:
+        return "link", None, output
+    return None, None, None
+
+
+def peak_rss_kib():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def main():
+    args = sys.argv[1:]
+    start = time.time()
+    returncode = subprocess.call(args)
+    end = time.time()
+    kind, source, output = describe(args)
+    log = os.environ.get("CONAN_BOOST_PROFILE_LOG")
+    if kind and log:
+        record = {"kind": kind, "source": source, "output": output, "start": start, "end": end,
+                  "peak_rss_kib": peak_rss_kib(), "returncode": returncode}
+        # A single short O_APPEND write keeps lines from parallel actions intact
+        fd = os.open(log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(record) + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
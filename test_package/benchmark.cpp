@@ -0,0 +1,270 @@
+// Micro-benchmarks of the hot paths of the compiled Boost libraries, one JSON object per line.
+// Also the PGO training workload of the recipe (option pgo), so keep it representative.
+// BENCH_<LIB> enables the benchmarks of each library, the optional argument scales the iterations.
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#ifdef BENCH_REGEX
+#include <boost/regex.hpp>
+#endif
+#ifdef BENCH_DATE_TIME
+#include <boost/date_time/posix_time/posix_time.hpp>
+#endif
+#ifdef BENCH_SERIALIZATION
+#include <boost/archive/binary_iarchive.hpp>
+#include <boost/archive/binary_oarchive.hpp>
+#include <boost/archive/text_iarchive.hpp>
+#include <boost/archive/text_oarchive.hpp>
+#include <boost/serialization/string.hpp>
+#include <boost/serialization/vector.hpp>
+#endif
+#ifdef BENCH_IOSTREAMS
+#include <boost/iostreams/copy.hpp>
+#include <boost/iostreams/filter/gzip.hpp>
+#include <boost/iostreams/filtering_stream.hpp>
+#endif
+#ifdef BENCH_FILESYSTEM
+#include <boost/filesystem.hpp>
+#include <fstream>
+#endif
+#ifdef BENCH_THREAD
+#include <boost/asio/io_context.hpp>
+#include <boost/asio/post.hpp>
+#include <boost/thread/condition_variable.hpp>
+#include <boost/thread/mutex.hpp>
+#include <boost/thread/thread.hpp>
+#endif
+#ifdef BENCH_BZIP2
+#include <boost/iostreams/filter/bzip2.hpp>
+#endif
+#ifdef BENCH_LZMA
+#include <boost/iostreams/filter/lzma.hpp>
+#endif
+#ifdef BENCH_ZSTD
+#include <boost/iostreams/filter/zstd.hpp>
+#endif
+
+namespace {
+
+volatile std::size_t sink = 0;
+
+template <class F>
+void run(const char* name, long iterations, F f)
+{
+    f(0);  // warm up
+    auto start = std::chrono::steady_clock::now();
+    for (long i = 0; i < iterations; ++i)
+        f(i);
+    auto elapsed = std::chrono::duration<double, std::nano>(std::chrono::steady_clock::now() - start).count();
+    std::printf("{\"benchmark\": \"%s\", \"iterations\": %ld, \"ns_per_op\": %.1f}\n",
+                name, iterations, elapsed / iterations);
+}
+
+std::vector<std::string> sample_lines()
+{
+    std::vector<std::string> lines;
+    for (int i = 0; i < 64; ++i) {
+        std::ostringstream line;
+        if (i % 3 == 0)
+            line << "Subject: Re: build " << i << " of the matrix finished";
+        else
+            line << "2021-01-" << (10 + i % 18) << " 12:" << (10 + i % 50) << ":00 worker-" << i
+                 << " processed " << i * 37 << " records from user" << i << "@example.com";
+        lines.push_back(line.str());
+    }
+    return lines;
+}
+
+#ifdef BENCH_IOSTREAMS
+// Compression throughput of one iostreams filter pair, also reports the compression ratio
+template <class Compressor, class Decompressor>
+void run_filter(const char* name, const std::string& payload, long compress_iterations,
+                long decompress_iterations)
+{
+    std::string compressed;
+    std::string benchmark = std::string("iostreams_") + name + "_compress_1MiB";
+    run(benchmark.c_str(), compress_iterations, [&](long) {
+        std::ostringstream sink_stream;
+        {
+            boost::iostreams::filtering_ostream out;
+            out.push(Compressor());
+            out.push(sink_stream);
+            out << payload;
+        }
+        compressed = sink_stream.str();
+        sink += compressed.size();
+    });
+    benchmark = std::string("iostreams_") + name + "_decompress_1MiB";
+    run(benchmark.c_str(), decompress_iterations, [&](long) {
+        std::istringstream source(compressed);
+        std::ostringstream target;
+        boost::iostreams::filtering_istream in;
+        in.push(Decompressor());
+        in.push(source);
+        boost::iostreams::copy(in, target);
+        sink += target.str().size();
+    });
+    std::printf("{\"benchmark\": \"iostreams_%s_ratio\", \"ratio\": %.2f}\n", name,
+                static_cast<double>(payload.size()) / compressed.size());
+}
+#endif
+
+#ifdef BENCH_SERIALIZATION
+struct Record
+{
+    int id;
+    double value;
+    std::string name;
+    std::vector<int> samples;
+
+    template <class Archive>
+    void serialize(Archive& ar, const unsigned int)
+    {
+        ar & id & value & name & samples;
+    }
+};
+#endif
+
+}  // namespace
+
+int main(int argc, char** argv)
+{
+    const double scale = argc > 1 ? std::atof(argv[1]) : 1.0;
+    auto iterations = [scale](long n) { return n * scale > 1 ? static_cast<long>(n * scale) : 1L; };
+    const std::vector<std::string> lines = sample_lines();
+
+#ifdef BENCH_REGEX
+    const boost::regex subject("^Subject: (Re: |Aw: )*(.*)");
+    const boost::regex email("([a-z0-9._]+)@([a-z0-9.]+)\\.(com|org|net)");
+    run("regex_match", iterations(200000), [&](long i) {
+        boost::smatch match;
+        sink += boost::regex_match(lines[i % lines.size()], match, subject);
+    });
+    run("regex_search", iterations(100000), [&](long i) {
+        boost::smatch match;
+        sink += boost::regex_search(lines[i % lines.size()], match, email);
+    });
+#endif
+
+#ifdef BENCH_DATE_TIME
+    run("date_time_parse_format", iterations(100000), [&](long i) {
+        auto time = boost::posix_time::time_from_string(lines[1 + 3 * (i % 20)].substr(0, 19));
+        sink += boost::posix_time::to_iso_string(time).size();
+    });
+#endif
+
+#ifdef BENCH_SERIALIZATION
+    Record record{42, 3.5, "serialization benchmark record", std::vector<int>(256, 7)};
+    run("serialization_text_roundtrip", iterations(5000), [&](long) {
+        std::stringstream stream;
+        {
+            boost::archive::text_oarchive out(stream);
+            out << record;
+        }
+        Record copy;
+        boost::archive::text_iarchive in(stream);
+        in >> copy;
+        sink += copy.samples.size();
+    });
+    run("serialization_binary_roundtrip", iterations(20000), [&](long) {
+        std::stringstream stream;
+        {
+            boost::archive::binary_oarchive out(stream);
+            out << record;
+        }
+        Record copy;
+        boost::archive::binary_iarchive in(stream);
+        in >> copy;
+        sink += copy.samples.size();
+    });
+#endif
+
+#ifdef BENCH_FILESYSTEM
+    namespace fs = boost::filesystem;
+    const fs::path tree = fs::temp_directory_path() / fs::unique_path("boost-benchmark-%%%%-%%%%");
+    for (int d = 0; d < 20; ++d) {
+        fs::create_directories(tree / std::to_string(d) / "nested");
+        for (int f = 0; f < 50; ++f)
+            std::ofstream((tree / std::to_string(d) / (std::to_string(f) + ".txt")).string()) << lines[f];
+    }
+    run("filesystem_traverse_1000_files", iterations(200), [&](long) {
+        for (fs::recursive_directory_iterator it(tree), end; it != end; ++it)
+            sink += it->status().type() == fs::regular_file;
+    });
+    run("filesystem_path_ops", iterations(100000), [&](long i) {
+        fs::path path = tree / "a" / ".." / std::to_string(i % 20) / "nested" / "file.tar.gz";
+        sink += path.lexically_normal().extension().size() + path.filename().size();
+    });
+    fs::remove_all(tree);
+#endif
+
+#ifdef BENCH_THREAD
+    {
+        // Round trips between two threads through a mutex and a condition variable
+        boost::mutex mutex;
+        boost::condition_variable turn_changed;
+        long turn = 0;
+        bool stop = false;
+        boost::thread peer([&] {
+            boost::unique_lock<boost::mutex> lock(mutex);
+            while (true) {
+                while (turn % 2 == 0 && !stop)
+                    turn_changed.wait(lock);
+                if (stop)
+                    return;
+                ++turn;
+                turn_changed.notify_one();
+            }
+        });
+        run("thread_condvar_pingpong", iterations(20000), [&](long) {
+            boost::unique_lock<boost::mutex> lock(mutex);
+            ++turn;
+            turn_changed.notify_one();
+            while (turn % 2 == 1)
+                turn_changed.wait(lock);
+        });
+        {
+            boost::lock_guard<boost::mutex> lock(mutex);
+            stop = true;
+        }
+        turn_changed.notify_one();
+        peer.join();
+    }
+    run("thread_create_join", iterations(2000), [&](long i) {
+        boost::thread worker([i] { sink += i; });
+        worker.join();
+    });
+    run("asio_post_run_1000_handlers", iterations(2000), [&](long) {
+        boost::asio::io_context context;
+        for (int h = 0; h < 1000; ++h)
+            boost::asio::post(context, [] { ++sink; });
+        context.run();
+    });
+#endif
+
+#ifdef BENCH_IOSTREAMS
+    std::string payload;
+    for (int i = 0; payload.size() < (1 << 20); ++i)
+        payload += lines[i % lines.size()] + " seq=" + std::to_string(i * 7919 % 100003) + "\n";
+    run_filter<boost::iostreams::gzip_compressor, boost::iostreams::gzip_decompressor>(
+        "gzip", payload, iterations(20), iterations(50));
+#ifdef BENCH_BZIP2
+    run_filter<boost::iostreams::bzip2_compressor, boost::iostreams::bzip2_decompressor>(
+        "bzip2", payload, iterations(5), iterations(10));
+#endif
+#ifdef BENCH_LZMA
+    run_filter<boost::iostreams::lzma_compressor, boost::iostreams::lzma_decompressor>(
+        "lzma", payload, iterations(3), iterations(20));
+#endif
+#ifdef BENCH_ZSTD
+    run_filter<boost::iostreams::zstd_compressor, boost::iostreams::zstd_decompressor>(
+        "zstd", payload, iterations(20), iterations(50));
+#endif
+#endif
+
+    return 0;
+}
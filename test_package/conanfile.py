@@ -1,7 +1,15 @@
 from conans.model.conan_file import ConanFile
 from conans import CMake
+import hashlib
+import json
 import os
+import subprocess
 import sys
+import time
+
+
+def benchmark_enabled():
+    return os.environ.get("CONAN_BOOST_RUN_BENCHMARK", "").lower() in ("1", "true", "yes")
 
 
 class DefaultNameConan(ConanFile):
@@ -14,14 +22,47 @@ class DefaultNameConan(ConanFile):
     #     if self.options["Boost"].header_only:
     #         self.settings.clear()
 
+    @property
+    def with_lambda(self):
+        """A minimal_headers package only has boost/lambda when header_only_libs lists it"""
+        header_only_libs = str(self.options["Boost"].get_safe("header_only_libs") or "")
+        return not self.options["Boost"].get_safe("minimal_headers") or \
+            "lambda" in header_only_libs.replace(",", " ").split()
+
     def build(self):
         cmake = CMake(self)
+        if self.with_lambda:
+            cmake.definitions["WITH_LAMBDA"] = "TRUE"
         if self.options["Boost"].header_only:
             cmake.definitions["HEADER_ONLY"] = "TRUE"
+        else:
+            for lib in ["regex", "date_time", "serialization", "iostreams", "filesystem", "thread"]:
+                if not self.options["Boost"].get_safe("without_%s" % lib):
+                    cmake.definitions["WITH_%s" % lib.upper()] = "TRUE"
+            for backend in ["bzip2", "lzma", "zstd"]:
+                if self.options["Boost"].get_safe("with_%s" % backend):
+                    cmake.definitions["WITH_%s" % backend.upper()] = "TRUE"
         # if not self.options["Boost"].without_python:
         #     cmake.definitions["WITH_PYTHON"] = "TRUE"
         cmake.configure()
+        if self.options["Boost"].get_safe("pch"):
+            self.measure_pch(cmake)
         cmake.build()
+        if benchmark_enabled() and not self.options["Boost"].header_only:
+            cmake.build(target="benchmark")
+            if self.options["Boost"].shared:
+                cmake.build(target="startup")
+
+    def measure_pch(self, cmake):
+        """Compile time of one consumer translation unit with and without the precompiled headers"""
+        elapsed = {}
+        for target in ("pch_consumer_plain", "pch_consumer_pch"):
+            start = time.time()
+            cmake.build(target=target)
+            elapsed[target] = time.time() - start
+        plain, pch = elapsed["pch_consumer_plain"], elapsed["pch_consumer_pch"]
+        self.output.info("Consumer compile time: %.1fs parsing the Boost headers, %.1fs with the precompiled "
+                         "headers (%.0f%% less)" % (plain, pch, 100.0 * (plain - pch) / plain))
 
     def imports(self):
         self.copy(pattern="*.dll", dst="bin", src="bin")
@@ -29,11 +70,105 @@ class DefaultNameConan(ConanFile):
         
     def test(self):        
         data_file = os.path.join(self.source_folder, "data.txt")
-        self.run("cd bin && .%slambda < %s" % (os.sep, data_file))
+        if self.with_lambda:
+            self.run("cd bin && .%slambda < %s" % (os.sep, data_file))
         if not self.options["Boost"].header_only:
             self.run("cd bin && .%sregex_exe < %s" % (os.sep, data_file))
+            if benchmark_enabled():
+                self.run_benchmark()
             # if not self.options["Boost"].without_python:
             #     os.chdir("bin")
             #     sys.path.append(".")
             #     import hello_ext
             #     hello_ext.greet()
+
+    @property
+    def benchmark_configuration(self):
+        """Settings and the Boost options that change the binaries, identifies a results file"""
+        configuration = dict((name, str(value)) for name, value in self.settings.values_list)
+        for option in ["shared", "fPIC", "lto", "pgo", "tuning", "slim_shared", "unity_build",
+                       "with_bzip2", "with_lzma", "with_zstd"]:
+            value = self.options["Boost"].get_safe(option)
+            if value is not None:
+                configuration["Boost:%s" % option] = str(value)
+        return configuration
+
+    def shared_library_results(self):
+        """Consumer startup time, loading and relocating the shared libraries, and their size"""
+        startup = os.path.join("bin", "startup")
+        runs = 200
+        start = time.time()
+        for _ in range(runs):
+            subprocess.check_call([os.path.abspath(startup)], cwd="bin")
+        elapsed = time.time() - start
+        size = 0
+        for lib_path in self.deps_cpp_info["Boost"].lib_paths:
+            for filename in os.listdir(lib_path):
+                path = os.path.join(lib_path, filename)
+                if (".so" in filename or filename.endswith((".dylib", ".dll"))) and not os.path.islink(path):
+                    size += os.path.getsize(path)
+        return [{"benchmark": "consumer_startup", "iterations": runs, "ns_per_op": round(elapsed / runs * 1e9, 1)},
+                {"benchmark": "shared_libraries_size", "bytes": size}]
+
+    def run_benchmark(self):
+        """Runs the benchmark, stores its results per configuration and, with
+        CONAN_BOOST_BENCHMARK_BASELINE, fails on benchmarks slower than the baseline by more than
+        CONAN_BOOST_BENCHMARK_THRESHOLD percent
+        """
+        raw_file = os.path.abspath("benchmark.jsonl")
+        self.run("cd bin && .%sbenchmark %s > %s" % (os.sep, os.environ.get("CONAN_BOOST_BENCHMARK_SCALE", "1"),
+                                                      raw_file))
+        results = [json.loads(line) for line in open(raw_file)]
+        if self.options["Boost"].shared:
+            results.extend(self.shared_library_results())
+        configuration = self.benchmark_configuration
+        digest = hashlib.sha1(json.dumps(configuration, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        results_name = "benchmark-%s.json" % digest
+        results_dir = os.environ.get("CONAN_BOOST_BENCHMARK_RESULTS_DIR", os.getcwd())
+        if not os.path.isdir(results_dir):
+            os.makedirs(results_dir)
+        results_file = os.path.join(results_dir, results_name)
+        with open(results_file, "w") as output:
+            json.dump({"configuration": configuration, "results": results}, output, indent=2)
+
+        # A results file, or a folder of them where the one of this configuration is picked
+        baseline = {}
+        baseline_file = os.environ.get("CONAN_BOOST_BENCHMARK_BASELINE")
+        if baseline_file and os.path.isdir(baseline_file):
+            baseline_file = os.path.join(baseline_file, results_name)
+        if baseline_file and os.path.exists(baseline_file):
+            with open(baseline_file) as stored:
+                content = stored.read()
+            try:
+                stored_results = json.loads(content)["results"]
+            except ValueError:  # raw json lines of a former run
+                stored_results = [json.loads(line) for line in content.splitlines() if line.strip()]
+            baseline = dict((r["benchmark"], r.get("ns_per_op", r.get("bytes"))) for r in stored_results
+                            if "ns_per_op" in r or "bytes" in r)
+        elif baseline_file:
+            self.output.warn("No benchmark baseline %s" % baseline_file)
+        threshold = float(os.environ.get("CONAN_BOOST_BENCHMARK_THRESHOLD", "10"))
+
+        regressions = []
+        for result in results:
+            if "ratio" in result:  # compression ratio of an iostreams filter
+                self.output.info("%-32s %12.2f" % (result["benchmark"], result["ratio"]))
+                continue
+            if "bytes" in result:
+                line = "%-32s %12.1f MB" % (result["benchmark"], result["bytes"] / 1e6)
+                if result["benchmark"] in baseline:
+                    line += "  %+.1f%% vs baseline" % (100.0 * (result["bytes"] / baseline[result["benchmark"]] - 1))
+                self.output.info(line)
+                continue
+            line = "%-32s %12.1f ns/op" % (result["benchmark"], result["ns_per_op"])
+            if result["benchmark"] in baseline:
+                change = 100.0 * (result["ns_per_op"] / baseline[result["benchmark"]] - 1)
+                line += "  %+.1f%% vs baseline" % change
+                if change > threshold:
+                    regressions.append(result["benchmark"])
+                    line += "  REGRESSION"
+            self.output.info(line)
+        self.output.info("Benchmark results written to %s" % results_file)
+        if regressions:
+            raise Exception("Benchmarks slower than the baseline by more than %s%%: %s"
+                            % (threshold, ", ".join(regressions)))
@@ -0,0 +1,6 @@
+// Compiled with the precompiled Boost headers (option pch) force-included, and with the same
+// headers parsed from source, the test_package compares both compile times.
+int main()
+{
+    return 0;
+}
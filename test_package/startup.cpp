@@ -0,0 +1,32 @@
+// Touches one symbol of each shared Boost library and exits, the test_package measures how long
+// the process takes to load and relocate them. BENCH_<LIB> selects the libraries.
+#ifdef BENCH_REGEX
+#include <boost/regex.hpp>
+#endif
+#ifdef BENCH_DATE_TIME
+#include <boost/date_time/gregorian/gregorian.hpp>
+#endif
+#ifdef BENCH_FILESYSTEM
+#include <boost/filesystem/path.hpp>
+#endif
+#ifdef BENCH_THREAD
+#include <boost/thread/thread.hpp>
+#endif
+
+int main()
+{
+    int used = 0;
+#ifdef BENCH_REGEX
+    used += boost::regex_match("startup", boost::regex("s.*"));
+#endif
+#ifdef BENCH_DATE_TIME
+    used += boost::gregorian::from_simple_string("2021-01-01").day();
+#endif
+#ifdef BENCH_FILESYSTEM
+    used += boost::filesystem::path("a/b.txt").extension().string().size();
+#endif
+#ifdef BENCH_THREAD
+    used += boost::thread::hardware_concurrency() > 0;
+#endif
+    return used > 0 ? 0 : 1;
+}